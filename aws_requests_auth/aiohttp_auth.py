@@ -0,0 +1,43 @@
+"""
+Signature version 4 authentication for aiohttp clients, as a client
+middleware (aiohttp 3.12+). aiohttp is not a strict requirement of the
+aws-requests-auth package.
+
+Example usage for talking to an AWS Elasticsearch Service:
+
+    signer = AWSSigV4Signer(aws_access_key='YOURKEY',
+                            aws_secret_access_key='YOURSECRET',
+                            aws_host='search-service-foobar.us-east-1.es.amazonaws.com',
+                            aws_region='us-east-1',
+                            aws_service='es')
+    async with aiohttp.ClientSession(middlewares=[AWSAiohttpMiddleware(signer)]) as session:
+        async with session.get('https://search-service-foobar.us-east-1.es.amazonaws.com') as response:
+            print(await response.text())
+
+Use boto_utils.BotoAWSSigV4Signer as the signer to sign with the credentials
+botocore discovers.
+"""
+
+from .asyncio_utils import AsyncSignerAdapter
+from .signing import STREAMING_PAYLOAD, SigningRequest
+
+
+class AWSAiohttpMiddleware(AsyncSignerAdapter):
+    """
+    aiohttp client middleware signing requests with an AWSSigV4Signer
+    """
+
+    def __init__(self, signer):
+        if signer.payload_signing == STREAMING_PAYLOAD:
+            raise ValueError('STREAMING_PAYLOAD is not supported with aiohttp')
+        super(AWSAiohttpMiddleware, self).__init__(signer)
+
+    async def __call__(self, request, handler):
+        body = None
+        if self.signer.payload_signing is None:
+            body = request.body
+            if not isinstance(body, bytes):
+                body = await body.as_bytes()
+        signing_request = SigningRequest(request.method, str(request.url), body, request.headers)
+        request.headers.update(await self.get_aws_request_headers_async(signing_request))
+        return await handler(request)
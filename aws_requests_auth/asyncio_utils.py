@@ -0,0 +1,54 @@
+"""
+Shared plumbing for the asyncio integrations in httpx_auth and aiohttp_auth.
+
+These modules require python 3. They wrap any AWSSigV4Signer (including
+boto_utils.BotoAWSSigV4Signer) so that signing never blocks the event loop:
+credential refreshes and hashing of large payloads run in the loop's
+default executor.
+"""
+
+import asyncio
+
+# Payloads larger than this are hashed in the executor instead of on the
+# event loop. hashlib releases the GIL while hashing large buffers.
+EXECUTOR_HASH_THRESHOLD = 1024 * 1024
+
+
+class AsyncSignerAdapter(object):
+    """
+    Base class of the asyncio integrations, holding the wrapped signer
+    """
+
+    def __init__(self, signer):
+        self.signer = signer
+        self._credentials_refresh = None
+
+    async def get_aws_credentials_async(self):
+        """
+        Returns the signer's credentials. When botocore has to refresh them,
+        the refresh runs in an executor, and concurrent callers wait on the
+        same refresh rather than each starting their own.
+        """
+        if not self.signer.credentials_refresh_needed():
+            return self.signer.get_aws_credentials()
+
+        if self._credentials_refresh is None:
+            loop = asyncio.get_event_loop()
+            self._credentials_refresh = loop.run_in_executor(None, self.signer.get_aws_credentials)
+            self._credentials_refresh.add_done_callback(self._clear_credentials_refresh)
+        return await asyncio.shield(self._credentials_refresh)
+
+    def _clear_credentials_refresh(self, future):
+        self._credentials_refresh = None
+
+    async def get_aws_request_headers_async(self, r):
+        """
+        Async counterpart of AWSSigV4Signer.get_aws_request_headers_handler()
+        """
+        credentials = await self.get_aws_credentials_async()
+        body = r.body
+        if body is not None and len(body) > EXECUTOR_HASH_THRESHOLD:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(
+                None, lambda: self.signer.get_aws_request_headers(r, **credentials))
+        return self.signer.get_aws_request_headers(r, **credentials)
@@ -4,9 +4,32 @@ External libraries, like boto, that this file imports are not a strict requireme
 aws-requests-auth package.
 """
 
-from botocore.session import Session
+import logging
+import threading
+import weakref
 
 from .aws_auth import AWSRequestsAuth
+from .multiprocessing_utils import ForkAwareMixin
+from .routing import AWSRoutingAuth
+from .signing import AWSSigV4Signer
+from .stats import clock
+
+logger = logging.getLogger(__name__)
+
+
+def Session():
+    """
+    Returns a new botocore.session.Session. botocore takes a while to
+    import, so it is only imported once credentials have to be discovered,
+    typically when the first auth object is built. Named after the class it
+    stands in for, which this module used to import.
+    """
+    from botocore.session import Session
+    return Session()
+
+
+# Guards the discovery of the credentials of unpickled auth objects
+_discovery_lock = threading.Lock()
 
 
 def get_credentials(credentials_obj=None):
@@ -29,9 +52,203 @@ def get_credentials(credentials_obj=None):
     }
 
 
-class BotoAWSRequestsAuth(AWSRequestsAuth):
+class CredentialsRefresher(object):
+    """
+    Daemon thread calling `signer.refresh_credentials()` every `interval`
+    seconds. The thread only holds a weak reference to the signer and exits
+    once the signer is garbage collected or stop() is called.
+    """
+
+    def __init__(self, signer, interval):
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        args=(weakref.ref(signer),),
+                                        name='aws-requests-auth-credentials-refresher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self, signer_ref):
+        while not self._stopped.wait(self.interval):
+            signer = signer_ref()
+            if signer is None:
+                return
+            try:
+                signer.refresh_credentials()
+            except Exception:
+                logger.exception('Failed to refresh AWS credentials, retrying in %s seconds', self.interval)
+            del signer
+
+    def stop(self):
+        self._stopped.set()
+
+
+class BotoCredentialsMixin(ForkAwareMixin):
+    """
+    Provides get_aws_credentials() from the credentials botocore discovers,
+    and refreshes, on its own. Shared by BotoAWSSigV4Signer and
+    BotoAWSRoutingAuth; the class using it must have a signing_key_cache
+    and a stats attribute.
+
+    Instances can be pickled, and keep working in child processes after
+    os.fork(), see _reinit_process_local().
+    """
+
+    # botocore's credentials can not be pickled, and threads do not survive forks
+    _process_local_attributes = ('_refreshable_credentials', '_credentials_refresher')
 
-    def __init__(self, aws_host, aws_region, aws_service):
+    def _init_boto_credentials(self, background_refresh_interval=None, shared_credentials=None):
+        """
+        The aws_access_key, aws_secret_access_key, and aws_token are discovered
+        automatically from the environment, in the order described here:
+        http://boto3.readthedocs.io/en/latest/guide/configuration.html#configuring-credentials
+
+        By default, botocore refreshes expiring credentials inline, while a
+        request is being signed, and every thread signing at that moment waits
+        on the STS/IMDS round trip. With background_refresh_interval set, a
+        daemon thread asks botocore for the credentials every that many
+        seconds instead, so they are refreshed ahead of their expiry, and
+        requests are signed with the latest snapshot without ever blocking.
+        The interval must be well under botocore's 15 minute advisory refresh
+        window; a minute is a good default.
+
+        With a multiprocessing_utils.SharedCredentials as shared_credentials,
+        the credentials are published there every time they are refreshed,
+        and copies of this object in child processes (forked, or unpickled
+        by a multiprocessing Process or Pool initializer) sign with them
+        instead of discovering and refreshing credentials of their own. The
+        process creating the object has to keep running, with a
+        background_refresh_interval unless the credentials are static.
+        """
+        self._background_refresh_interval = background_refresh_interval
+        self._shared_credentials = shared_credentials
+        self._reads_shared_credentials = False
+        self._refreshable_credentials = Session().get_credentials()
+        self._last_secret_access_key = None
+        self._credentials_snapshot = None
+        self._credentials_refresher = None
+        refreshable = hasattr(self._refreshable_credentials, 'refresh_needed')
+        if shared_credentials is not None and background_refresh_interval is None and refreshable:
+            raise ValueError('shared_credentials are only kept fresh with a background_refresh_interval')
+        if background_refresh_interval is not None or shared_credentials is not None:
+            self.refresh_credentials()
+        if background_refresh_interval is not None and refreshable:
+            # static credentials never change, no need for a thread
+            self._credentials_refresher = CredentialsRefresher(self, background_refresh_interval)
+        self._register_fork_aware()
+
+    def _reinit_process_local(self):
+        """
+        Called in child processes after os.fork(), and when unpickled:
+            - with shared_credentials, signs with the credentials published
+              by the parent process from now on.
+            - forked, keeps using the credentials botocore discovered in the
+              parent, and restarts the background refresh thread, if any.
+            - unpickled, discovers the credentials again on first use.
+        """
+        super(BotoCredentialsMixin, self)._reinit_process_local()
+        refreshable_credentials = self.__dict__.get('_refreshable_credentials')
+        background_refresh = self.__dict__.get('_credentials_refresher') is not None
+        self._credentials_refresher = None
+        if self._shared_credentials is not None:
+            self._reads_shared_credentials = True
+            self._refreshable_credentials = None
+            self._credentials_snapshot = None
+            return
+
+        self._refreshable_credentials = refreshable_credentials
+        if refreshable_credentials is None:
+            self._credentials_snapshot = None
+            return
+        if hasattr(refreshable_credentials, '_refresh_lock'):
+            # another thread of the parent may have been refreshing the
+            # credentials while forking, leaving botocore's lock held forever
+            refreshable_credentials._refresh_lock = threading.Lock()
+        if background_refresh:
+            self._credentials_refresher = CredentialsRefresher(self, self._background_refresh_interval)
+
+    def get_aws_credentials(self):
+        credentials = self._credentials_snapshot
+        if credentials is not None:
+            return credentials
+        if self._reads_shared_credentials:
+            return self._track_rotation(self._shared_credentials.read())
+        if self._refreshable_credentials is None:
+            with _discovery_lock:
+                if self._refreshable_credentials is None:
+                    self._init_boto_credentials(self._background_refresh_interval)
+            return self.get_aws_credentials()
+        # provide credentials explicitly during each __call__, to take advantage
+        # of botocore's underlying logic to refresh expired credentials
+        stats = self.stats
+        if stats is not None and self.credentials_refresh_needed():
+            started = clock()
+            credentials = get_credentials(self._refreshable_credentials)
+            stats.record('credentials_refreshes')
+            stats.record('credentials_refresh_seconds', clock() - started)
+            return self._track_rotation(credentials)
+        return self._track_rotation(get_credentials(self._refreshable_credentials))
+
+    def refresh_credentials(self):
+        """
+        Fetches the credentials from botocore, which refreshes them if they
+        are about to expire, and publishes them as the snapshot used to sign
+        requests. Called by the background refresh thread.
+        """
+        credentials = self._track_rotation(get_credentials(self._refreshable_credentials))
+        if self._shared_credentials is not None:
+            self._shared_credentials.publish(credentials)
+        self._credentials_snapshot = credentials
+
+    def _track_rotation(self, credentials):
+        secret_access_key = credentials['aws_secret_access_key']
+        if secret_access_key != self._last_secret_access_key:
+            # credentials were rotated, the old signing keys will not be used again
+            if self._last_secret_access_key is not None:
+                self.signing_key_cache.invalidate(self._last_secret_access_key)
+            self._last_secret_access_key = secret_access_key
+        return credentials
+
+    def credentials_refresh_needed(self):
+        if self._credentials_snapshot is not None or self._reads_shared_credentials:
+            return False
+        if self._refreshable_credentials is None:
+            # unpickled, the credentials have to be discovered
+            return True
+        refresh_needed = getattr(self._refreshable_credentials, 'refresh_needed', None)
+        return refresh_needed() if refresh_needed is not None else False
+
+    def close(self):
+        """
+        Stops the background refresh thread, if any. Requests keep being
+        signed, refreshing the credentials inline again.
+        """
+        if self._credentials_refresher is not None:
+            self._credentials_refresher.stop()
+            self._credentials_refresher = None
+        self._credentials_snapshot = None
+
+
+class BotoAWSSigV4Signer(BotoCredentialsMixin, AWSSigV4Signer):
+    """
+    AWSSigV4Signer that signs with the credentials botocore discovers, and
+    refreshes, on its own. BotoAWSRequestsAuth and the async integrations
+    are built on top of it.
+    """
+
+    def __init__(self, aws_host, aws_region, aws_service, background_refresh_interval=None,
+                 shared_credentials=None, **kwargs):
+        """
+        See BotoCredentialsMixin for how credentials are discovered, and
+        the background_refresh_interval and shared_credentials options.
+        """
+        super(BotoAWSSigV4Signer, self).__init__(None, None, aws_host, aws_region, aws_service, **kwargs)
+        self._init_boto_credentials(background_refresh_interval, shared_credentials)
+
+
+class BotoAWSRequestsAuth(BotoAWSSigV4Signer, AWSRequestsAuth):
+
+    def __init__(self, aws_host, aws_region, aws_service, **kwargs):
         """
         Example usage for talking to an AWS Elasticsearch Service:
 
@@ -43,11 +260,17 @@ class BotoAWSRequestsAuth(AWSRequestsAuth):
         automatically from the environment, in the order described here:
         http://boto3.readthedocs.io/en/latest/guide/configuration.html#configuring-credentials
         """
-        super(BotoAWSRequestsAuth, self).__init__(None, None, aws_host, aws_region, aws_service)
-        self._refreshable_credentials = Session().get_credentials()
+        super(BotoAWSRequestsAuth, self).__init__(aws_host, aws_region, aws_service, **kwargs)
 
-    def get_aws_request_headers_handler(self, r):
-        # provide credentials explicitly during each __call__, to take advantage
-        # of botocore's underlying logic to refresh expired credentials
-        credentials = get_credentials(self._refreshable_credentials)
-        return self.get_aws_request_headers(r, **credentials)
+
+class BotoAWSRoutingAuth(BotoCredentialsMixin, AWSRoutingAuth):
+
+    def __init__(self, background_refresh_interval=None, shared_credentials=None, **kwargs):
+        """
+        AWSRoutingAuth signing with the credentials botocore discovers, see
+        BotoCredentialsMixin. Example usage:
+
+        BotoAWSRoutingAuth(endpoints={'search.internal.example.com': ('us-east-1', 'es')})
+        """
+        super(BotoAWSRoutingAuth, self).__init__(**kwargs)
+        self._init_boto_credentials(background_refresh_interval, shared_credentials)
@@ -0,0 +1,54 @@
+"""
+Signature version 4 authentication for httpx clients. httpx is not a strict
+requirement of the aws-requests-auth package.
+
+Example usage for talking to an AWS Elasticsearch Service:
+
+    signer = AWSSigV4Signer(aws_access_key='YOURKEY',
+                            aws_secret_access_key='YOURSECRET',
+                            aws_host='search-service-foobar.us-east-1.es.amazonaws.com',
+                            aws_region='us-east-1',
+                            aws_service='es')
+    async with httpx.AsyncClient(auth=AWSHttpxAuth(signer)) as client:
+        response = await client.get('https://search-service-foobar.us-east-1.es.amazonaws.com')
+
+Use boto_utils.BotoAWSSigV4Signer as the signer to sign with the credentials
+botocore discovers.
+"""
+
+import httpx
+
+from .asyncio_utils import AsyncSignerAdapter
+from .signing import STREAMING_PAYLOAD, UNSIGNED_PAYLOAD, SigningRequest
+
+
+class AWSHttpxAuth(AsyncSignerAdapter, httpx.Auth):
+    """
+    httpx.Auth signing requests with an AWSSigV4Signer. Works with both
+    httpx.Client and httpx.AsyncClient.
+    """
+
+    def __init__(self, signer):
+        if signer.payload_signing == STREAMING_PAYLOAD:
+            raise ValueError('STREAMING_PAYLOAD is not supported with httpx')
+        super(AWSHttpxAuth, self).__init__(signer)
+        # unsigned payloads are signed without reading the body
+        self.requires_request_body = signer.payload_signing != UNSIGNED_PAYLOAD
+
+    def sync_auth_flow(self, request):
+        if self.requires_request_body:
+            request.read()
+        aws_headers = self.signer.get_aws_request_headers_handler(self._signing_request(request))
+        request.headers.update(aws_headers)
+        yield request
+
+    async def async_auth_flow(self, request):
+        if self.requires_request_body:
+            await request.aread()
+        aws_headers = await self.get_aws_request_headers_async(self._signing_request(request))
+        request.headers.update(aws_headers)
+        yield request
+
+    def _signing_request(self, request):
+        body = request.content if self.requires_request_body else None
+        return SigningRequest(request.method, str(request.url), body, request.headers)
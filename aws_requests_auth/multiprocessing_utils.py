@@ -0,0 +1,146 @@
+"""
+Support for signing from several processes: multiprocessing pools, and
+pre-forking servers like gunicorn.
+
+Auth objects can be pickled, and are fork-aware: the locks and threads they
+hold are re-created in child processes after os.fork() (python 3.7+), so a
+parent can build them once before forking. SharedCredentials lets children
+sign with the credentials their parent keeps refreshing, instead of each
+of them asking botocore (and IMDS or STS) for their own.
+"""
+
+import os
+import threading
+import weakref
+
+# Objects whose _reinit_process_local() is called in child processes
+_fork_aware_objects = weakref.WeakSet()
+
+
+def _reinit_after_fork():
+    for obj in list(_fork_aware_objects):
+        obj._reinit_process_local()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reinit_after_fork)
+
+
+class ForkAwareMixin(object):
+    """
+    Base class of the objects holding state that is only valid in the
+    process that created it, like locks and threads.
+
+    The `_process_local_attributes` declared by the class and its bases
+    are dropped when pickling. _reinit_process_local() is called to
+    re-create them when unpickling, and in child processes after os.fork().
+    """
+
+    _process_local_attributes = ()
+
+    def _register_fork_aware(self):
+        _fork_aware_objects.add(self)
+
+    def _reinit_process_local(self):
+        """
+        Re-creates the process local attributes. Other attributes may or
+        may not have been carried over from the original object.
+        """
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get('_process_local_attributes', ()):
+                state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reinit_process_local()
+        self._register_fork_aware()
+
+
+class ForkSafeLockMixin(ForkAwareMixin):
+    """
+    ForkAwareMixin for objects guarding their state with `self._lock`. A
+    lock held by another thread while forking would never be released in
+    the child, so the child gets a new one.
+    """
+
+    _process_local_attributes = ('_lock',)
+
+    def _init_lock(self):
+        self._lock = threading.Lock()
+        self._register_fork_aware()
+
+    def _reinit_process_local(self):
+        super(ForkSafeLockMixin, self)._reinit_process_local()
+        self._lock = threading.Lock()
+
+
+class SharedCredentials(object):
+    """
+    AWS credentials in shared memory, published by one process and read by
+    any number of others.
+
+    The credentials are stored as json in a fixed size buffer, next to a
+    version counter bumped on every publish(). Readers keep the last
+    credentials they decoded, and only take the lock and decode them again
+    once the version has changed, so read() is cheap enough to be called
+    for every request.
+
+    Like every multiprocessing shared object, it has to be created before
+    the processes reading it are started, and be passed to them by
+    inheritance (fork) or as an argument of Process or Pool's initializer.
+    See boto_utils.BotoAWSRequestsAuth's shared_credentials option.
+    """
+
+    def __init__(self, size=8192, context=None):
+        # multiprocessing and json are only imported when needed, to keep the
+        # signing core quick to import
+        if context is None:
+            import multiprocessing as context
+        self.size = size
+        self._buffer = context.RawArray('c', size)
+        self._length = context.RawValue('L', 0)
+        self._version = context.RawValue('L', 0)
+        self._lock = context.Lock()
+        self._cached = (0, None)
+
+    @property
+    def version(self):
+        """
+        Number of times credentials were published
+        """
+        return self._version.value
+
+    def publish(self, credentials):
+        """
+        Publishes `credentials`, a dict of the keyword arguments of
+        AWSSigV4Signer.get_aws_request_headers() (aws_access_key,
+        aws_secret_access_key and aws_token)
+        """
+        import json
+        data = json.dumps(credentials, sort_keys=True).encode('utf-8')
+        if len(data) > self.size:
+            raise ValueError('Credentials need %d bytes, more than the %d bytes of the shared buffer'
+                             % (len(data), self.size))
+        with self._lock:
+            self._buffer[:len(data)] = data
+            self._length.value = len(data)
+            self._version.value += 1
+
+    def read(self):
+        """
+        Returns the last credentials published, or None if there are none yet
+        """
+        version, credentials = self._cached
+        if self._version.value == version:
+            return credentials
+        with self._lock:
+            version = self._version.value
+            data = self._buffer.raw[:self._length.value]
+        import json
+        credentials = json.loads(data.decode('utf-8'))
+        self._cached = (version, credentials)
+        return credentials
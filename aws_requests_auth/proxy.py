@@ -0,0 +1,370 @@
+"""
+Local signing proxy, letting programs that can not use this package (shell
+scripts, Go or JVM jobs...) talk to an AWS endpoint through one signer per
+host. Credentials are refreshed, and signing keys derived, in a single
+process instead of in every job:
+
+    aws-sigv4-proxy https://search-foo.us-east-1.es.amazonaws.com --port 8080
+    curl http://127.0.0.1:8080/_cluster/health
+
+Requests are signed with the credentials botocore discovers, and sent over
+a pool of keep-alive connections (see session.signed_session). Bodies are
+streamed through in both directions, and GET STATS_PATH returns throughput,
+latency, signing and connection reuse statistics as json.
+
+Requires python 3.7+.
+"""
+
+import argparse
+import json
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import requests
+
+from .multiprocessing_utils import ForkSafeLockMixin
+from .routing import parse_aws_hostname
+from .session import signed_session
+from .signing import PAYLOAD_SPOOL_SIZE, STREAMING_PAYLOAD, UNSIGNED_PAYLOAD
+from .stats import SigningStats, clock
+
+# Path of the statistics endpoint, never forwarded
+STATS_PATH = '/_sigv4_proxy/stats'
+
+# Headers that only apply to one connection, never forwarded
+HOP_BY_HOP_HEADERS = frozenset([
+    'connection',
+    'keep-alive',
+    'proxy-authenticate',
+    'proxy-authorization',
+    'proxy-connection',
+    'te',
+    'trailer',
+    'transfer-encoding',
+    'upgrade',
+])
+
+# Request headers set by requests or by the signer
+REPLACED_REQUEST_HEADERS = HOP_BY_HOP_HEADERS | frozenset([
+    'authorization',
+    'content-length',
+    'host',
+    'x-amz-content-sha256',
+    'x-amz-date',
+    'x-amz-security-token',
+])
+
+# Size of the chunks bodies are streamed in
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Number of recent requests latency percentiles are computed over
+LATENCY_SAMPLES = 1024
+
+
+class ProxyStats(ForkSafeLockMixin):
+    """
+    Thread-safe counters of the requests forwarded by a proxy: requests,
+    upstream_errors (requests that could not be forwarded), bytes_received
+    and bytes_sent (request and response bodies), and their latency, from
+    the request line to the last byte of the response.
+    """
+
+    def __init__(self):
+        self._init_lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Sets every counter back to zero
+        """
+        with self._lock:
+            self._started = clock()
+            self._values = dict.fromkeys(('requests', 'upstream_errors', 'bytes_received', 'bytes_sent',
+                                          'latency_seconds'), 0)
+            self._latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def record(self, latency, bytes_received, bytes_sent, upstream_error=False):
+        """
+        Records a request forwarded in `latency` seconds
+        """
+        with self._lock:
+            values = self._values
+            values['requests'] += 1
+            values['upstream_errors'] += int(upstream_error)
+            values['bytes_received'] += bytes_received
+            values['bytes_sent'] += bytes_sent
+            values['latency_seconds'] += latency
+            self._latencies.append(latency)
+
+    def snapshot(self):
+        """
+        Returns the counters as a dict, plus requests_per_second since the
+        last reset, and the mean, median and 99th percentile latency of the
+        last LATENCY_SAMPLES requests (None until the first request)
+        """
+        with self._lock:
+            values = dict(self._values)
+            latencies = sorted(self._latencies)
+            elapsed = clock() - self._started
+        values['requests_per_second'] = values['requests'] / elapsed if elapsed > 0 else None
+        if latencies:
+            values['latency_mean_seconds'] = sum(latencies) / len(latencies)
+            values['latency_p50_seconds'] = latencies[len(latencies) // 2]
+            values['latency_p99_seconds'] = latencies[int(len(latencies) * 0.99)]
+        else:
+            values['latency_mean_seconds'] = values['latency_p50_seconds'] = values['latency_p99_seconds'] = None
+        return values
+
+
+class ContentReader(object):
+    """
+    File-like view of the next `length` bytes of a stream. Its len() tells
+    requests to send it with a Content-Length, instead of chunked.
+    """
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.remaining = length
+        self.received = 0
+
+    def __len__(self):
+        return self.remaining
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.stream.read(size) if size else b''
+        self.remaining -= len(data)
+        self.received += len(data)
+        return data
+
+
+class ChunkedReader(object):
+    """
+    Iterates over the decoded chunks of a chunked transfer-encoded stream
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.received = 0
+
+    def __iter__(self):
+        while True:
+            size = int(self.stream.readline(65537).split(b';', 1)[0].strip() or b'0', 16)
+            if not size:
+                # skip the trailers
+                while self.stream.readline(65537) not in (b'\r\n', b'\n', b''):
+                    pass
+                return
+            chunk = self.stream.read(size)
+            self.stream.readline()
+            self.received += len(chunk)
+            yield chunk
+
+
+class SigningProxyHandler(BaseHTTPRequestHandler):
+    """
+    Forwards requests to the endpoint of the SigningProxyServer, signed
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == STATS_PATH:
+            self._send_stats()
+        else:
+            self._forward()
+
+    def _forward(self):
+        started = clock()
+        server = self.server
+        body = self._request_body()
+        headers = [(name, value) for name, value in self.headers.items()
+                   if name.lower() not in REPLACED_REQUEST_HEADERS]
+        try:
+            response = server.session.request(self.command, server.endpoint + self.path,
+                                              headers=dict(headers), data=body, stream=True,
+                                              allow_redirects=False)
+        except requests.RequestException as e:
+            # recorded before answering, so the failure is counted by the time
+            # the client sees it
+            server.stats.record(clock() - started, self._received(body), 0, upstream_error=True)
+            # the request body may not have been read entirely
+            self.close_connection = True
+            self.send_error(502, 'Could not forward the request: %s' % e)
+            return
+
+        try:
+            bytes_sent = self._relay(response)
+        except Exception:
+            response.close()
+            raise
+        # the response was read entirely, keep its connection alive
+        response.raw.release_conn()
+        server.stats.record(clock() - started, self._received(body), bytes_sent)
+
+    do_DELETE = do_HEAD = do_OPTIONS = do_PATCH = do_POST = do_PUT = _forward
+
+    def _request_body(self):
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            return ChunkedReader(self.rfile)
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return None
+        if length <= PAYLOAD_SPOOL_SIZE:
+            # small enough to be signed, and retried, as bytes
+            return self.rfile.read(length)
+        return ContentReader(self.rfile, length)
+
+    @staticmethod
+    def _received(body):
+        if body is None:
+            return 0
+        if isinstance(body, bytes):
+            return len(body)
+        return body.received
+
+    def _relay(self, response):
+        """
+        Sends the upstream `response` back to the client, and returns the
+        number of bytes of its body
+        """
+        # response hooks, like the clock skew one reading small 400 and 403
+        # bodies, may have read and decoded the body already
+        consumed = response._content_consumed
+        self.send_response_only(response.status_code, response.reason)
+        content_length = None
+        for name, value in response.raw.headers.items():
+            lowered = name.lower()
+            if lowered in HOP_BY_HOP_HEADERS:
+                continue
+            if consumed and lowered in ('content-encoding', 'content-length'):
+                continue
+            if lowered == 'content-length':
+                content_length = value
+            self.send_header(name, value)
+        if consumed:
+            content_length = str(len(response.content))
+            self.send_header('Content-Length', content_length)
+
+        no_body = self.command == 'HEAD' or response.status_code in (204, 304) or response.status_code < 200
+        chunked = content_length is None and not no_body
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        if no_body:
+            return 0
+
+        if consumed:
+            chunks = [response.content]
+        else:
+            chunks = response.raw.stream(STREAM_CHUNK_SIZE, decode_content=False)
+        bytes_sent = 0
+        for chunk in chunks:
+            if not chunk:
+                continue
+            if chunked:
+                self.wfile.write(('%x\r\n' % len(chunk)).encode('ascii') + chunk + b'\r\n')
+            else:
+                self.wfile.write(chunk)
+            bytes_sent += len(chunk)
+        if chunked:
+            self.wfile.write(b'0\r\n\r\n')
+        return bytes_sent
+
+    def _send_stats(self):
+        server = self.server
+        signing_stats = getattr(server.session.auth, 'stats', None)
+        body = json.dumps({
+            'proxy': server.stats.snapshot(),
+            'signing': signing_stats.snapshot() if signing_stats is not None else None,
+            'connections': server.session.get_adapter(server.endpoint).connection_stats(),
+        }, sort_keys=True).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class SigningProxyServer(ThreadingHTTPServer):
+    """
+    HTTP server forwarding the requests it receives to `endpoint` (e.g.
+    https://search-foo.us-east-1.es.amazonaws.com), signed with `auth`.
+    Each client connection is handled by its own thread, and the upstream
+    connections are pooled, up to `concurrency` of them; see
+    session.signed_session for `max_retries`.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, server_address, endpoint, auth, concurrency=32, max_retries=3, verbose=False):
+        self.endpoint = endpoint.rstrip('/')
+        self.session = signed_session(auth, concurrency=concurrency, hosts=1, max_retries=max_retries)
+        # forward the clients' headers only
+        self.session.headers.clear()
+        self.stats = ProxyStats()
+        self.verbose = verbose
+        ThreadingHTTPServer.__init__(self, server_address, SigningProxyHandler)
+
+    def server_close(self):
+        ThreadingHTTPServer.server_close(self)
+        self.session.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local proxy signing requests to an AWS endpoint with the '
+                                                 'credentials botocore discovers')
+    parser.add_argument('endpoint', help='url of the AWS endpoint, e.g. https://search-foo.us-east-1.es.amazonaws.com')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=8080, help='port to listen on (default: %(default)s)')
+    parser.add_argument('--region', help='region to sign for (default: parsed from the endpoint)')
+    parser.add_argument('--service', help='service to sign for (default: parsed from the endpoint)')
+    parser.add_argument('--concurrency', type=int, default=32,
+                        help='upstream connections kept alive (default: %(default)s)')
+    parser.add_argument('--max-retries', type=int, default=3,
+                        help='retries of throttled requests, and of 5xx responses to idempotent '
+                             'requests (default: %(default)s)')
+    parser.add_argument('--background-refresh-interval', type=float, default=60,
+                        help='seconds between credential refreshes (default: %(default)s)')
+    parser.add_argument('--payload-signing', choices=[UNSIGNED_PAYLOAD, STREAMING_PAYLOAD],
+                        help='do not hash request bodies up front (S3 only)')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args(argv)
+
+    aws_host = urlsplit(args.endpoint).netloc
+    region, service = args.region, args.service
+    if region is None or service is None:
+        parsed = parse_aws_hostname(aws_host.split(':')[0])
+        if parsed is None:
+            parser.error('--region and --service are required for %s' % aws_host)
+        region, service = region or parsed[0], service or parsed[1]
+
+    # botocore is only needed by the proxy's main
+    from .boto_utils import BotoAWSRequestsAuth
+    auth = BotoAWSRequestsAuth(aws_host=aws_host,
+                               aws_region=region,
+                               aws_service=service,
+                               background_refresh_interval=args.background_refresh_interval,
+                               payload_signing=args.payload_signing,
+                               stats=SigningStats())
+    server = SigningProxyServer((args.host, args.port), args.endpoint, auth,
+                                concurrency=args.concurrency, max_retries=args.max_retries, verbose=args.verbose)
+    print('Signing requests to %s (%s, %s) on http://%s:%d' % (args.endpoint, region, service,
+                                                              args.host, server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        auth.close()
+
+
+if __name__ == '__main__':
+    main()
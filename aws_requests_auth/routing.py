@@ -0,0 +1,213 @@
+"""
+Signs requests to many AWS endpoints (hosts, regions and services) with a
+single auth object, e.g. one requests.Session talking to several
+Elasticsearch domains and S3 buckets.
+"""
+
+import re
+from collections import OrderedDict
+
+try:
+    # python 2
+    from urlparse import urlsplit
+except ImportError:
+    # python 3
+    from urllib.parse import urlsplit
+
+import requests
+
+from .multiprocessing_utils import ForkSafeLockMixin
+from .aws_auth import resend_after_clock_skew
+from .signing import AWSSigV4Signer, SigningClock, SigningKeyCache
+
+# e.g. us-east-1, eu-central-2, us-gov-west-1, cn-north-1, us-isob-east-1
+REGION_PATTERN = re.compile(r'^[a-z]{2}(-gov|-iso[a-z]?)?-[a-z]+-\d+$')
+
+# Services whose endpoints put the region before the service name,
+# e.g. search-foo.us-east-1.es.amazonaws.com
+REGION_FIRST_SERVICES = ('es', 'aoss')
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def parse_aws_hostname(hostname):
+    """
+    Returns the (region, service) of a standard AWS endpoint hostname, or
+    None if `hostname` is not one. For example:
+
+        search-foo.us-east-1.es.amazonaws.com      -> ('us-east-1', 'es')
+        examplebucket.s3.eu-west-1.amazonaws.com   -> ('eu-west-1', 's3')
+        examplebucket.s3-eu-west-1.amazonaws.com   -> ('eu-west-1', 's3')
+        examplebucket.s3.amazonaws.com             -> ('us-east-1', 's3')
+        abc123.execute-api.us-east-1.amazonaws.com -> ('us-east-1', 'execute-api')
+        sqs.us-east-1.amazonaws.com                -> ('us-east-1', 'sqs')
+
+    Hostnames without a region belong to us-east-1.
+    """
+    hostname = hostname.lower()
+    for suffix in ('.amazonaws.com', '.amazonaws.com.cn'):
+        if hostname.endswith(suffix):
+            labels = hostname[:-len(suffix)].split('.')
+            break
+    else:
+        return None
+
+    for index, label in enumerate(labels):
+        if label.startswith('s3-') and REGION_PATTERN.match(label[3:]):
+            # legacy examplebucket.s3-eu-west-1.amazonaws.com
+            return label[3:], 's3'
+        if REGION_PATTERN.match(label):
+            region = label
+            if 's3' in labels[:index]:
+                # s3.dualstack.eu-west-1.amazonaws.com and friends
+                return region, 's3'
+            if index + 1 < len(labels) and labels[index + 1] in REGION_FIRST_SERVICES:
+                return region, labels[index + 1]
+            if index > 0:
+                return region, _strip_fips(labels[index - 1])
+            return None
+
+    if 's3' in labels:
+        return 'us-east-1', 's3'
+    return 'us-east-1', _strip_fips(labels[-1])
+
+
+def _strip_fips(service):
+    return service[:-len('-fips')] if service.endswith('-fips') else service
+
+
+class AWSRoutingAuth(ForkSafeLockMixin, requests.auth.AuthBase):
+    """
+    Auth class signing each request for the endpoint its url points to.
+
+    The region and service of a host are looked up in `endpoints` (a dict of
+    hostname -> (region, service)), then asked to each of the `rules`
+    (callables taking a hostname and returning (region, service) or None),
+    and finally parsed from standard AWS hostnames with parse_aws_hostname().
+
+    One AWSSigV4Signer is kept per endpoint, with its precomputed signing
+    context; the `max_endpoints` most recently used ones are kept. All of
+    them share one SigningKeyCache and SigningClock, and the `stats` object
+    if one is given.
+
+    Example usage:
+
+    auth = AWSRoutingAuth(aws_access_key='YOURKEY',
+                          aws_secret_access_key='YOURSECRET',
+                          endpoints={'search.internal.example.com': ('us-east-1', 'es')})
+    session = requests.Session()
+    session.auth = auth
+    session.get('https://search-foo.us-east-1.es.amazonaws.com/_search')
+    session.get('https://examplebucket.s3.eu-west-1.amazonaws.com/test.txt')
+
+    Other keyword arguments (payload_signing, ...) are passed on to each
+    AWSSigV4Signer.
+    """
+
+    def __init__(self,
+                 aws_access_key=None,
+                 aws_secret_access_key=None,
+                 aws_token=None,
+                 endpoints=None,
+                 rules=(),
+                 max_endpoints=64,
+                 signing_key_cache=None,
+                 stats=None,
+                 signing_clock=None,
+                 **signer_kwargs):
+        self.aws_access_key = aws_access_key
+        self.aws_secret_access_key = aws_secret_access_key
+        self.aws_token = aws_token
+        self.endpoints = dict(endpoints or {})
+        self.rules = list(rules)
+        self.max_endpoints = max_endpoints
+        self.signing_key_cache = signing_key_cache if signing_key_cache is not None else SigningKeyCache()
+        self.stats = stats
+        self.signing_clock = signing_clock if signing_clock is not None else SigningClock()
+        self.signer_kwargs = signer_kwargs
+        self._signers = OrderedDict()
+        self._init_lock()
+
+    # the signers are cheap to rebuild, and hold caches of their own
+    _process_local_attributes = ('_lock', '_signers')
+
+    def _reinit_process_local(self):
+        super(AWSRoutingAuth, self)._reinit_process_local()
+        self._signers = OrderedDict()
+
+    def __call__(self, r):
+        """
+        Adds the signature version 4 headers for the endpoint of `r`
+        """
+        r.headers.update(self.get_aws_request_headers_handler(r))
+        r.register_hook('response', self.handle_clock_skew)
+        return r
+
+    def get_aws_request_headers_handler(self, r):
+        """
+        Returns the signature version 4 headers of `r`, for its endpoint
+        """
+        return self.get_signer(r.url).get_aws_request_headers(r, **self.get_aws_credentials())
+
+    def handle_clock_skew(self, response, **kwargs):
+        """
+        Response hook sending requests rejected because of the host's clock
+        again, see aws_auth.resend_after_clock_skew()
+        """
+        return resend_after_clock_skew(response, self.signing_clock, self.get_aws_request_headers_handler, **kwargs)
+
+    def get_aws_credentials(self):
+        """
+        Returns the keyword arguments for get_aws_request_headers() holding
+        the AWS credentials to sign with, see AWSSigV4Signer
+        """
+        return {
+            'aws_access_key': self.aws_access_key,
+            'aws_secret_access_key': self.aws_secret_access_key,
+            'aws_token': self.aws_token,
+        }
+
+    def resolve_endpoint(self, hostname):
+        """
+        Returns the (region, service) to sign requests to `hostname` for
+        """
+        if hostname in self.endpoints:
+            return self.endpoints[hostname]
+        for rule in self.rules:
+            endpoint = rule(hostname)
+            if endpoint is not None:
+                return endpoint
+        endpoint = parse_aws_hostname(hostname)
+        if endpoint is None:
+            raise ValueError('Can not tell the AWS region and service of %r, '
+                             'add it to the endpoints or rules of AWSRoutingAuth' % hostname)
+        return endpoint
+
+    def get_signer(self, url):
+        """
+        Returns the AWSSigV4Signer for the endpoint `url` points to
+        """
+        parsedurl = urlsplit(url)
+        signer_key = (parsedurl.scheme, parsedurl.netloc)
+        with self._lock:
+            signer = self._signers.pop(signer_key, None)
+            if signer is not None:
+                # re-insert to mark the endpoint as most recently used
+                self._signers[signer_key] = signer
+                return signer
+
+        hostname = parsedurl.hostname
+        aws_host = hostname
+        if parsedurl.port is not None and parsedurl.port != DEFAULT_PORTS.get(parsedurl.scheme):
+            aws_host += ':%d' % parsedurl.port
+        region, service = self.resolve_endpoint(hostname)
+        signer = AWSSigV4Signer(None, None, aws_host, region, service,
+                                signing_key_cache=self.signing_key_cache,
+                                stats=self.stats,
+                                signing_clock=self.signing_clock,
+                                **self.signer_kwargs)
+        with self._lock:
+            self._signers[signer_key] = signer
+            while len(self._signers) > self.max_endpoints:
+                self._signers.popitem(last=False)
+        return signer
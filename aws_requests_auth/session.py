@@ -0,0 +1,157 @@
+"""
+requests.Session factory for clients sending many signed requests from
+many threads, e.g. bulk indexers.
+
+urllib3 keeps at most 10 connections per host by default: with more threads
+than that, connections are thrown away after every request, and new ones
+pay for a TLS handshake. signed_session() sizes the pools from the expected
+concurrency, and retries throttled or failed requests by signing them
+again, without hashing their body again.
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from urllib3.exceptions import MaxRetryError
+    from urllib3.util.retry import Retry
+except ImportError:
+    # old requests releases vendoring urllib3
+    from requests.packages.urllib3.exceptions import MaxRetryError
+    from requests.packages.urllib3.util.retry import Retry
+
+from .signing import IMMUTABLE_BODY_TYPES
+
+# Statuses of throttled requests and of transient server errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Statuses of requests that were not processed, safe to retry whatever
+# their method
+THROTTLED_STATUSES = (429, 503)
+
+
+class SigningHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter retrying the responses with a status in the
+    status_forcelist of `max_retries` (a urllib3 Retry, or a number of
+    retries) by signing the request again with `auth`.
+
+    urllib3 would retry them with the original signature, which may have
+    expired by the time it gives up backing off. The request is re-signed
+    the way AWSRequestsAuth.resign() does: the body is not hashed again.
+    Only requests whose body can be replayed are retried, and the Retry's
+    backoff and Retry-After handling are honored. Connection errors are
+    retried by urllib3, as usual.
+
+    The Retry's allowed_methods only apply to server errors: throttled
+    requests (THROTTLED_STATUSES) were not processed, so they are retried
+    whatever their method, e.g. the POSTs of bulk indexers.
+    """
+
+    __attrs__ = HTTPAdapter.__attrs__ + ['auth', 'status_retries']
+
+    def __init__(self, auth, max_retries=0, **kwargs):
+        self.auth = auth
+        self.status_retries = Retry.from_int(max_retries)
+        # the statuses are retried by send(), not by urllib3
+        super(SigningHTTPAdapter, self).__init__(
+            max_retries=self.status_retries.new(status_forcelist=None, respect_retry_after_header=False),
+            **kwargs)
+
+    def send(self, request, **kwargs):
+        retries = self.status_retries
+        history = []
+        while True:
+            response = super(SigningHTTPAdapter, self).send(request, **kwargs)
+            if not (request.body is None or isinstance(request.body, IMMUTABLE_BODY_TYPES)):
+                break
+            if not self._is_retry(retries, request.method, response):
+                break
+            try:
+                retries = retries.increment(request.method, request.url, response=response.raw)
+            except MaxRetryError:
+                break
+
+            # Consume content and release the original connection
+            # to allow our new request to reuse the same one.
+            response.content
+            response.close()
+            history.append(response)
+            retries.sleep(response.raw)
+
+            # the credentials may have changed to ones without a session token
+            request.headers.pop('X-Amz-Security-Token', None)
+            request.headers.update(self.auth.get_aws_request_headers_handler(request))
+
+        response.history = history + response.history
+        return response
+
+    @staticmethod
+    def _is_retry(retries, method, response):
+        """
+        Retry.is_retry(), retrying throttled requests whatever their method
+        """
+        status = response.status_code
+        has_retry_after = 'Retry-After' in response.headers
+        if status not in THROTTLED_STATUSES:
+            return retries.is_retry(method, status, has_retry_after)
+        return (status in (retries.status_forcelist or ()) or
+                bool(retries.total and retries.respect_retry_after_header and has_retry_after))
+
+    def connection_stats(self):
+        """
+        Returns a dict of the number of connection pools, connections opened
+        and requests sent by this adapter, and of how many of the requests
+        reused a kept-alive connection (connections_reused and reuse_rate,
+        None until the first request).
+
+        Only the pools currently held are counted: set pool_connections to
+        at least the number of hosts talked to, so pools are not evicted.
+        """
+        managers = [self.poolmanager] + list(self.proxy_manager.values())
+        pools = [manager.pools[key] for manager in managers for key in manager.pools.keys()]
+        connections = sum(pool.num_connections for pool in pools)
+        sent = sum(pool.num_requests for pool in pools)
+        reused = max(sent - connections, 0)
+        return {
+            'pools': len(pools),
+            'connections_opened': connections,
+            'requests': sent,
+            'connections_reused': reused,
+            'reuse_rate': float(reused) / sent if sent else None,
+        }
+
+
+def signed_session(auth, concurrency=10, hosts=10, max_retries=3, backoff_factor=0.5, pool_block=False):
+    """
+    Returns a requests.Session signing its requests with `auth`, e.g. an
+    AWSRequestsAuth or a BotoAWSRequestsAuth, and keeping up to
+    `concurrency` connections alive to each of up to `hosts` hosts:
+
+    session = signed_session(BotoAWSRequestsAuth(aws_host='search-foo.us-east-1.es.amazonaws.com',
+                                                 aws_region='us-east-1',
+                                                 aws_service='es'),
+                             concurrency=32)
+
+    Set `concurrency` to the number of threads sharing the session. Requests
+    answered with one of RETRY_STATUSES are signed and sent again up to
+    `max_retries` times, backing off exponentially with `backoff_factor`;
+    pass a urllib3 Retry as `max_retries` for full control. Throttled
+    requests are retried whatever their method, server errors only for
+    idempotent methods, see SigningHTTPAdapter. With
+    `pool_block`, threads wait for a free connection instead of opening
+    connections that are discarded once the pool is full.
+
+    Connection reuse is reported by session.get_adapter(url).connection_stats().
+    """
+    if not isinstance(max_retries, Retry):
+        max_retries = Retry(total=max_retries, backoff_factor=backoff_factor, status_forcelist=RETRY_STATUSES)
+    session = requests.Session()
+    session.auth = auth
+    for prefix in ('https://', 'http://'):
+        session.mount(prefix, SigningHTTPAdapter(auth,
+                                                 max_retries=max_retries,
+                                                 pool_connections=hosts,
+                                                 pool_maxsize=concurrency,
+                                                 pool_block=pool_block))
+    return session
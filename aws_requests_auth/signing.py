@@ -0,0 +1,1285 @@
+import hmac
+import hashlib
+import datetime
+import mmap
+import os
+import time
+from collections import OrderedDict
+
+from .multiprocessing_utils import ForkSafeLockMixin
+from .stats import CANONICALIZE_SECONDS, DERIVE_KEY_SECONDS, HASH_PAYLOAD_SECONDS, SIGN_SECONDS, clock
+
+try:
+    # python 2
+    from urllib import quote, unquote as unquote_to_bytes
+    from urlparse import urlsplit, urlunsplit
+except ImportError:
+    # python 3
+    from urllib.parse import quote, unquote_to_bytes, urlsplit, urlunsplit
+
+try:
+    from functools import lru_cache
+except ImportError:
+    # python 2
+    lru_cache = None
+
+
+def sign(key, msg):
+    """
+    Copied from https://docs.aws.amazon.com/general/latest/gr/sigv4-signed-request-examples.html
+    """
+    return hmac.new(key, msg.encode('utf-8'), hashlib.sha256).digest()
+
+
+def getSignatureKey(key, dateStamp, regionName, serviceName):
+    """
+    Copied from https://docs.aws.amazon.com/general/latest/gr/sigv4-signed-request-examples.html
+    """
+    kDate = sign(('AWS4' + key).encode('utf-8'), dateStamp)
+    kRegion = sign(kDate, regionName)
+    kService = sign(kRegion, serviceName)
+    kSigning = sign(kService, 'aws4_request')
+    return kSigning
+
+
+# Marker values of the x-amz-content-sha256 header for requests whose
+# payload is not hashed up front, see AWSSigV4Signer's payload_signing
+UNSIGNED_PAYLOAD = 'UNSIGNED-PAYLOAD'
+STREAMING_PAYLOAD = 'STREAMING-AWS4-HMAC-SHA256-PAYLOAD'
+
+# Number of canonical paths and query strings memoized
+CANONICALIZATION_CACHE_SIZE = 1024
+
+# Size of the reads used to hash (and replay) file-like and generator bodies
+PAYLOAD_CHUNK_SIZE = 64 * 1024
+
+# Generator bodies are buffered in memory up to this size while being
+# hashed, larger bodies are spooled to a temporary file
+PAYLOAD_SPOOL_SIZE = 1024 * 1024
+
+
+def hash_payload(body, chunk_size=PAYLOAD_CHUNK_SIZE):
+    """
+    Returns a tuple of (hex encoded sha256 of `body`, body to send).
+
+    `body` may be anything `requests` accepts as a request body: None,
+    bytes, text, a file-like object or an iterable of chunks.
+
+    Seekable file objects are rewound after hashing and sent as-is. Regular
+    files are memory mapped and hashed through a memoryview, so no copy of
+    the payload is made. Bodies that can only be read once (generators,
+    pipes, sockets) are hashed chunk by chunk while being spooled to a
+    temporary file, and a generator replaying the spooled chunks is
+    returned in their place.
+    """
+    payload_hash, body, _ = _hash_payload(body, chunk_size)
+    return payload_hash, body
+
+
+def _hash_payload(body, chunk_size):
+    """
+    hash_payload(), also returning the number of bytes hashed
+    """
+    if body is None:
+        return hashlib.sha256(b'').hexdigest(), body, 0
+
+    if hasattr(body, 'read'):
+        return _hash_file(body, chunk_size)
+
+    if hasattr(body, 'encode') or isinstance(body, (bytes, bytearray, memoryview)):
+        data = body
+        try:
+            data = body.encode('utf-8')
+        except (AttributeError, UnicodeDecodeError):
+            # On py2, if unicode characters in present in `body`,
+            # encode() throws UnicodeDecodeError, but we can safely
+            # pass unencoded `body` to execute hexdigest().
+            #
+            # For py3, encode() will execute successfully regardless
+            # of the presence of unicode data
+            pass
+        return hashlib.sha256(data).hexdigest(), body, len(data)
+
+    return _hash_iterable(body, chunk_size)
+
+
+def _hash_file(fileobj, chunk_size):
+    try:
+        position = fileobj.tell()
+        fileobj.seek(position)
+    except (AttributeError, IOError, OSError, ValueError):
+        # not seekable, so it can only be read once
+        return _hash_iterable(_read_chunks(fileobj, chunk_size), chunk_size)
+
+    hashed = _hash_mmap(fileobj, position)
+    if hashed is not None:
+        payload_hash, length = hashed
+    else:
+        digest = hashlib.sha256()
+        length = 0
+        for chunk in _read_chunks(fileobj, chunk_size):
+            chunk = _to_bytes(chunk)
+            digest.update(chunk)
+            length += len(chunk)
+        fileobj.seek(position)
+        payload_hash = digest.hexdigest()
+    return payload_hash, fileobj, length
+
+
+def _hash_mmap(fileobj, position):
+    """
+    Hashes a regular, binary file from `position` onwards without reading it
+    into memory. Returns a tuple of (hex encoded sha256, number of bytes
+    hashed), or None if `fileobj` can not be memory mapped.
+    """
+    if 'b' not in getattr(fileobj, 'mode', 'b'):
+        return None
+    try:
+        fileno = fileobj.fileno()
+        if position >= os.fstat(fileno).st_size:
+            return None
+        mapped = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    except (AttributeError, IOError, OSError, ValueError):
+        return None
+
+    try:
+        view = memoryview(mapped)
+    except TypeError:
+        # python 2 can't take a memoryview of an mmap
+        mapped.close()
+        return None
+    try:
+        return hashlib.sha256(view[position:]).hexdigest(), len(view) - position
+    finally:
+        view.release()
+        mapped.close()
+
+
+def _hash_iterable(chunks, chunk_size):
+    digest = hashlib.sha256()
+    spool = _spool()
+    for chunk in chunks:
+        chunk = _to_bytes(chunk)
+        digest.update(chunk)
+        spool.write(chunk)
+    length = spool.tell()
+    spool.seek(0)
+    return digest.hexdigest(), _replay_spool(spool, chunk_size), length
+
+
+def _spool():
+    # tempfile is slow to import, and only needed for bodies of unknown size
+    import tempfile
+    return tempfile.SpooledTemporaryFile(max_size=PAYLOAD_SPOOL_SIZE)
+
+
+def _replay_spool(spool, chunk_size):
+    try:
+        for chunk in _read_chunks(spool, chunk_size):
+            yield chunk
+    finally:
+        spool.close()
+
+
+def _read_chunks(fileobj, chunk_size):
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _to_bytes(chunk):
+    if isinstance(chunk, bytes):
+        return chunk
+    try:
+        return chunk.encode('utf-8')
+    except (AttributeError, UnicodeDecodeError):
+        return bytes(chunk)
+
+
+def _payload_length(body):
+    """
+    Returns a tuple of (length of `body` in bytes, body to send). Bodies of
+    unknown length are spooled to a temporary file to measure them.
+    """
+    if body is None:
+        return 0, body
+    if hasattr(body, 'encode') or isinstance(body, (bytes, bytearray, memoryview)):
+        return len(_to_bytes(body)), body
+    if hasattr(body, 'read'):
+        try:
+            position = body.tell()
+            try:
+                end = os.fstat(body.fileno()).st_size
+            except (AttributeError, IOError, OSError, ValueError):
+                body.seek(0, os.SEEK_END)
+                end = body.tell()
+                body.seek(position)
+            return max(end - position, 0), body
+        except (AttributeError, IOError, OSError, ValueError):
+            body = _read_chunks(body, PAYLOAD_CHUNK_SIZE)
+
+    spool = _spool()
+    for chunk in body:
+        spool.write(_to_bytes(chunk))
+    length = spool.tell()
+    spool.seek(0)
+    return length, spool
+
+
+def _aws_chunked_length(decoded_length, chunk_size):
+    """
+    Returns the Content-Length of the aws-chunked encoding of a payload
+    of `decoded_length` bytes
+    """
+    def framed_length(size):
+        # hex(size);chunk-signature=<64 hex chars>\r\n<chunk>\r\n
+        return len('%x' % size) + len(';chunk-signature=') + 64 + 2 + size + 2
+
+    full_chunks, remainder = divmod(decoded_length, chunk_size)
+    length = full_chunks * framed_length(chunk_size) + framed_length(0)
+    if remainder:
+        length += framed_length(remainder)
+    return length
+
+
+def aws_chunked(body, signing_key, amzdate, credential_scope, seed_signature,
+                chunk_size=PAYLOAD_CHUNK_SIZE):
+    """
+    Generator encoding `body` with the aws-chunked content encoding used by
+    STREAMING-AWS4-HMAC-SHA256-PAYLOAD requests. Each chunk is signed with
+    the signature of the previous chunk, starting from `seed_signature`
+    (the signature of the request itself), and is only read and hashed
+    when the transport asks for it.
+
+    Every chunk but the last is exactly `chunk_size` bytes; S3 requires
+    chunks of at least 8 KiB.
+
+    See https://docs.aws.amazon.com/AmazonS3/latest/API/sigv4-streaming.html
+    """
+    string_to_sign_prefix = ('AWS4-HMAC-SHA256-PAYLOAD\n' + amzdate + '\n' +
+                             credential_scope + '\n')
+    empty_hash = hashlib.sha256(b'').hexdigest()
+    previous_signature = seed_signature
+    for chunk in _fixed_size_chunks(body, chunk_size):
+        string_to_sign = (string_to_sign_prefix + previous_signature + '\n' +
+                          empty_hash + '\n' + hashlib.sha256(chunk).hexdigest())
+        previous_signature = hmac.new(signing_key,
+                                      string_to_sign.encode('utf-8'),
+                                      hashlib.sha256).hexdigest()
+        yield ('%x;chunk-signature=%s\r\n' % (len(chunk), previous_signature)).encode('utf-8')
+        if chunk:
+            yield chunk
+        yield b'\r\n'
+
+
+def _fixed_size_chunks(body, chunk_size):
+    """
+    Yields `body` in chunks of exactly `chunk_size` bytes (bar the last one),
+    followed by the empty chunk that terminates an aws-chunked payload
+    """
+    if body is None:
+        body = b''
+    if hasattr(body, 'encode') or isinstance(body, (bytes, bytearray, memoryview)):
+        view = memoryview(_to_bytes(body))
+        for offset in range(0, len(view), chunk_size):
+            yield view[offset:offset + chunk_size]
+    else:
+        pieces = _read_chunks(body, chunk_size) if hasattr(body, 'read') else body
+        buffered = bytearray()
+        for piece in pieces:
+            buffered += _to_bytes(piece)
+            while len(buffered) >= chunk_size:
+                yield bytes(buffered[:chunk_size])
+                del buffered[:chunk_size]
+        if buffered:
+            yield bytes(buffered)
+    yield b''
+
+
+def _canonical_path(path):
+    # safe chars adapted from boto's use of urllib.parse.quote
+    # https://github.com/boto/boto/blob/d9e5cfe900e1a58717e393c76a6e3580305f217a/boto/auth.py#L393
+    return quote(path if path else '/', safe='/-_.~')
+
+
+def _canonical_querystring(query):
+    params = []
+    for query_param in query.split('&'):
+        key, _, val = query_param.partition('=')
+        if key:
+            params.append((_uri_encode(key), _uri_encode(val)))
+    params.sort()
+    return '&'.join([key + '=' + val for key, val in params])
+
+
+def _uri_encode(value):
+    """
+    RFC 3986 encoding of a (possibly already encoded) query string key or
+    value. '+' stands for a space in query strings, like AWS decodes it.
+    """
+    return quote(unquote_to_bytes(value.replace('+', ' ')), safe='-_.~')
+
+
+if lru_cache is not None:
+    # requests to the same endpoint tend to repeat the same paths and query
+    # strings, so their canonical forms are memoized
+    canonical_path = lru_cache(maxsize=CANONICALIZATION_CACHE_SIZE)(_canonical_path)
+    canonical_querystring = lru_cache(maxsize=CANONICALIZATION_CACHE_SIZE)(_canonical_querystring)
+else:
+    canonical_path = _canonical_path
+    canonical_querystring = _canonical_querystring
+
+
+class SigningKeyCache(ForkSafeLockMixin):
+    """
+    Thread-safe, bounded cache of derived signing keys.
+
+    A signing key only depends on the secret key, the date, the region and
+    the service, so it can be reused for every request signed on the same
+    UTC day instead of re-running the four chained HMACs in getSignatureKey().
+
+    Entries are keyed on a fingerprint of the secret key (never the secret
+    itself). Keys for older dates are evicted as soon as a newer datestamp
+    is requested, and the least recently used entries are evicted once
+    `maxsize` is exceeded.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._datestamp = None
+        self._keys = OrderedDict()
+        # the secret key rarely changes, remember the fingerprint of the last one
+        self._last_fingerprint = (None, None)
+        self._init_lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    @staticmethod
+    def fingerprint(secret_key):
+        """
+        Returns a digest identifying `secret_key` without exposing it
+        """
+        return hashlib.sha256(secret_key.encode('utf-8')).hexdigest()
+
+    def get(self, secret_key, datestamp, region, service):
+        """
+        Returns the signing key for the given scope, deriving and caching it
+        with getSignatureKey() on a miss
+        """
+        return self.lookup(secret_key, datestamp, region, service)[0]
+
+    def lookup(self, secret_key, datestamp, region, service):
+        """
+        get(), returning a tuple of (signing key, whether it was cached)
+        """
+        last_secret_key, fingerprint = self._last_fingerprint
+        if secret_key is not last_secret_key:
+            fingerprint = self.fingerprint(secret_key)
+            self._last_fingerprint = (secret_key, fingerprint)
+        cache_key = (fingerprint, datestamp, region, service)
+        with self._lock:
+            if self._datestamp is None or datestamp > self._datestamp:
+                # UTC date rolled over, keys for earlier dates are now useless
+                self._datestamp = datestamp
+                for stale_key in [k for k in self._keys if k[1] != datestamp]:
+                    del self._keys[stale_key]
+            signing_key = self._keys.pop(cache_key, None)
+            if signing_key is not None:
+                # re-insert to mark the entry as most recently used
+                self._keys[cache_key] = signing_key
+                self.hits += 1
+                return signing_key, True
+            self.misses += 1
+
+        signing_key = getSignatureKey(secret_key, datestamp, region, service)
+        with self._lock:
+            self._keys[cache_key] = signing_key
+            while len(self._keys) > self.maxsize:
+                self._keys.popitem(last=False)
+        return signing_key, False
+
+    def invalidate(self, secret_key):
+        """
+        Drops every cached key derived from `secret_key`, e.g. after the
+        credentials have been rotated
+        """
+        fingerprint = self.fingerprint(secret_key)
+        with self._lock:
+            for stale_key in [k for k in self._keys if k[0] == fingerprint]:
+                del self._keys[stale_key]
+
+    def clear(self):
+        """
+        Drops every cached key and resets the hit/miss counters
+        """
+        with self._lock:
+            self._keys.clear()
+            self._datestamp = None
+            self.hits = 0
+            self.misses = 0
+
+
+# Signing algorithm of signature version 4
+SIGV4_ALGORITHM = 'AWS4-HMAC-SHA256'
+
+ONE_SECOND = datetime.timedelta(seconds=1)
+
+# Longest validity AWS accepts for a presigned url, 7 days
+MAX_PRESIGN_EXPIRES = 7 * 24 * 60 * 60
+
+NO_OFFSET = datetime.timedelta(0)
+
+# Error codes and messages of the responses AWS rejects requests with when
+# they were signed too far from its own time
+CLOCK_SKEW_ERRORS = (
+    'RequestTimeTooSkewed',
+    'RequestExpired',
+    'Signature expired',
+    'Signature not yet current',
+)
+
+
+def is_clock_skew_error(status_code, body):
+    """
+    Returns True if an AWS response with `status_code` and `body` (text)
+    rejected the request for being signed at the wrong time
+    """
+    return status_code in (400, 403) and any(error in body for error in CLOCK_SKEW_ERRORS)
+
+
+class SigningClock(object):
+    """
+    Source of the time requests are signed at: the UTC time of the host,
+    corrected by `offset`, a timedelta.
+
+    AWS rejects requests signed more than 5 minutes away from its own time.
+    When the host's clock drifts that far, learn_offset() sets the offset
+    from the Date header of the response rejecting a request, so that the
+    following requests are signed at AWS' time.
+    """
+
+    def __init__(self, offset=NO_OFFSET):
+        self.offset = offset
+
+    def now(self):
+        """
+        Returns the corrected current UTC time, as a naive datetime
+        """
+        offset = self.offset
+        if offset:
+            return datetime.datetime.utcnow() + offset
+        return datetime.datetime.utcnow()
+
+    def learn_offset(self, date_header):
+        """
+        Sets the offset to the difference between `date_header`, the Date
+        header of an AWS response, and the host's time. Returns True if the
+        offset changed by a second or more, False if it did not or if
+        `date_header` can not be parsed.
+        """
+        # email takes a while to import, and is rarely needed
+        from email.utils import mktime_tz, parsedate_tz
+        parsed = parsedate_tz(date_header) if date_header else None
+        if parsed is None:
+            return False
+        offset = datetime.timedelta(seconds=mktime_tz(parsed) - time.time())
+        if abs(offset - self.offset) < ONE_SECOND:
+            return False
+        self.offset = offset
+        return True
+
+
+class SigningContext(object):
+    """
+    The parts of the signing process that only depend on the endpoint
+    (host, region and service) and on the current time.
+
+    Built once per AWSSigV4Signer. at() hands out a SigningWindow holding
+    the time-dependent strings, which is rebuilt when the second ticks over,
+    so requests signed within the same second only hash and concatenate.
+    """
+
+    def __init__(self, aws_host, aws_region, aws_service, algorithm=None, scope_suffix=None):
+        """
+        `algorithm` and `scope_suffix` (the credential scope after the date)
+        default to those of signature version 4
+        """
+        self.host_header = 'host:' + aws_host + '\n'
+        self.algorithm = algorithm or SIGV4_ALGORITHM
+        if scope_suffix is None:
+            scope_suffix = '/' + aws_region + '/' + aws_service + '/aws4_request'
+        self.scope_suffix = scope_suffix
+        self._window = None
+
+    def at(self, t):
+        """
+        Returns the SigningWindow of the second `t` (a UTC datetime) falls in
+        """
+        window = self._window
+        if window is None or not window.start <= t < window.end:
+            # windows are immutable, so threads racing here at worst build
+            # the same window twice
+            window = self._window = SigningWindow(t, self.scope_suffix, window, self.algorithm)
+        return window
+
+
+class SigningWindow(object):
+    """
+    Time-dependent strings of a SigningContext, valid for one second.
+    Everything that only changes daily is carried over from the previous
+    window of the same day.
+    """
+
+    def __init__(self, t, scope_suffix, previous=None, algorithm=SIGV4_ALGORITHM):
+        self.algorithm = algorithm
+        self.start = t.replace(microsecond=0)
+        self.end = self.start + ONE_SECOND
+        self.amzdate = t.strftime('%Y%m%dT%H%M%SZ')
+        self.datestamp = self.amzdate[:8]  # Date w/o time for credential_scope
+        if previous is not None and previous.datestamp == self.datestamp:
+            self.credential_scope = previous.credential_scope
+            self._authorization_prefixes = previous._authorization_prefixes
+        else:
+            self.credential_scope = self.datestamp + scope_suffix
+            self._authorization_prefixes = {}
+        self.date_header = 'x-amz-date:' + self.amzdate + '\n'
+        self.string_to_sign_prefix = (algorithm + '\n' + self.amzdate + '\n' +
+                                      self.credential_scope + '\n')
+
+    def authorization_prefix(self, aws_access_key, signed_headers):
+        """
+        Returns the Authorization header up to the signature itself
+        """
+        key = (aws_access_key, signed_headers)
+        prefix = self._authorization_prefixes.get(key)
+        if prefix is None:
+            prefix = (self.algorithm + ' ' + 'Credential=' + aws_access_key +
+                      '/' + self.credential_scope + ', ' + 'SignedHeaders=' +
+                      signed_headers + ', ' + 'Signature=')
+            if len(self._authorization_prefixes) < 64:
+                self._authorization_prefixes[key] = prefix
+        return prefix
+
+
+class SignatureCache(ForkSafeLockMixin):
+    """
+    Opt-in, thread-safe LRU cache of the headers signed for a request.
+
+    Health checks and hot read paths often send byte-identical requests many
+    times per second. Their signatures only differ once x-amz-date changes,
+    so within one second the headers signed for the first request can be
+    handed out again instead of hashing and signing the canonical request.
+
+    Entries are keyed on the x-amz-date (first), endpoint, signing
+    algorithm, method, canonical URI and query string, payload hash and
+    credentials of the request, so signers for different endpoints can
+    share a cache. Entries of previous seconds are dropped as soon as a
+    newer second is seen.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._amzdate = None
+        self._headers = OrderedDict()
+        self._init_lock()
+
+    def __len__(self):
+        return len(self._headers)
+
+    def get(self, key):
+        """
+        Returns a copy of the headers cached for `key`, or None
+        """
+        amzdate = key[0]
+        with self._lock:
+            if self._amzdate is None or amzdate > self._amzdate:
+                self._amzdate = amzdate
+                self._headers.clear()
+            headers = self._headers.pop(key, None)
+            if headers is None:
+                self.misses += 1
+                return None
+            # re-insert to mark the entry as most recently used
+            self._headers[key] = headers
+            self.hits += 1
+        return dict(headers)
+
+    def put(self, key, headers):
+        """
+        Caches a copy of `headers` for `key`
+        """
+        with self._lock:
+            if key[0] != self._amzdate:
+                return
+            self._headers[key] = dict(headers)
+            while len(self._headers) > self.maxsize:
+                self._headers.popitem(last=False)
+
+
+# Bodies whose content can not change while they are alive, so that their
+# hash can be cached by identity
+IMMUTABLE_BODY_TYPES = (bytes, type(u''))
+
+
+class PayloadHashCache(ForkSafeLockMixin):
+    """
+    Thread-safe LRU cache of the sha256 of request bodies, keyed on the
+    identity of the body object.
+
+    Retries and other requests re-sending the same bytes or str body object
+    are signed without hashing it again. Callers that already know the hash
+    of a body, e.g. because they computed it while serializing it, can put()
+    it in the cache before sending the request.
+
+    Only immutable bodies (bytes and text) are cached. The cache holds a
+    reference to each of the `maxsize` most recent bodies, so that their
+    id() is not reused by another object, and an entry is only used if its
+    body `is` the body of the request. The cached bodies are kept alive
+    for as long as they are cached: with the default `maxsize` of 2, at
+    most two bodies are. Set `max_bytes` to also bound the total len() of
+    the cached bodies; bodies larger than that are not cached.
+    """
+
+    def __init__(self, maxsize=2, max_bytes=None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._hashes = OrderedDict()
+        self._bytes = 0
+        self._init_lock()
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def get(self, body):
+        """
+        Returns the hex encoded sha256 cached for `body`, or None
+        """
+        if not isinstance(body, IMMUTABLE_BODY_TYPES):
+            return None
+        with self._lock:
+            entry = self._hashes.pop(id(body), None)
+            if entry is None or entry[0] is not body:
+                self.misses += 1
+                return None
+            # re-insert to mark the entry as most recently used
+            self._hashes[id(body)] = entry
+            self.hits += 1
+        return entry[1]
+
+    def put(self, body, payload_hash):
+        """
+        Caches `payload_hash`, the hex encoded sha256 of `body`. Mutable
+        bodies are ignored.
+        """
+        if not isinstance(body, IMMUTABLE_BODY_TYPES):
+            return
+        max_bytes = self.max_bytes
+        if max_bytes is not None and len(body) > max_bytes:
+            return
+        with self._lock:
+            replaced = self._hashes.pop(id(body), None)
+            if replaced is not None:
+                self._bytes -= len(replaced[0])
+            self._hashes[id(body)] = (body, payload_hash)
+            self._bytes += len(body)
+            while len(self._hashes) > self.maxsize or (max_bytes is not None and self._bytes > max_bytes):
+                evicted, _ = self._hashes.popitem(last=False)[1]
+                self._bytes -= len(evicted)
+
+    def clear(self):
+        """
+        Drops every cached hash, and the references to their bodies
+        """
+        with self._lock:
+            self._hashes.clear()
+            self._bytes = 0
+
+
+def _content_sha256(headers):
+    """
+    Returns the x-amz-content-sha256 header of a request if it holds a
+    sha256 hex digest, None otherwise
+    """
+    value = headers.get('x-amz-content-sha256')
+    if value is None:
+        value = headers.get('X-Amz-Content-Sha256')
+    if value is None or len(value) != 64:
+        return None
+    value = value.lower()
+    try:
+        int(value, 16)
+    except ValueError:
+        return None
+    return value
+
+
+# Headers set by the signer itself, never taken from the request when
+# selecting the signed_headers
+SIGNER_HEADERS = frozenset([
+    'authorization',
+    'host',
+    'x-amz-content-sha256',
+    'x-amz-date',
+    'x-amz-decoded-content-length',
+    'x-amz-region-set',
+    'x-amz-security-token',
+])
+
+# Canonical forms of the most recent sets of extra signed headers memoized
+# per signer
+CANONICAL_HEADERS_CACHE_SIZE = 256
+
+
+def _header_text(value):
+    if isinstance(value, bytes) and not isinstance(value, str):
+        # python 3 bytes header value
+        return value.decode('utf-8')
+    return value
+
+
+def _canonical_header_items(items):
+    """
+    Returns the canonical form of the (lowercase name, value) header
+    `items`: values are trimmed, sequential spaces collapsed, repeated
+    headers joined with commas, and the result sorted by name.
+    """
+    canonical = {}
+    for name, value in items:
+        value = ' '.join(_header_text(value).split())
+        canonical[name] = canonical[name] + ',' + value if name in canonical else value
+    return tuple(sorted(canonical.items()))
+
+
+# Attribute of a signed request holding its CanonicalParts
+CANONICAL_PARTS_ATTRIBUTE = 'aws_canonical_parts'
+
+
+class CanonicalParts(object):
+    """
+    The parts of the canonical request of a signed request that do not
+    depend on the time or the credentials: canonical path, query string and
+    payload hash.
+
+    AWSSigV4Signer attaches them to the requests it signs, so that signing
+    the same request again, e.g. to retry it with a fresh x-amz-date, only
+    redoes the string to sign and its HMAC instead of re-hashing the body.
+    They are only used again as long as the method and url of the request
+    are unchanged and its body is still the same immutable object.
+    """
+
+    def __init__(self, method, url, body, canonical_uri, canonical_querystring, payload_hash):
+        self.method = method
+        self.url = url
+        self.body = body
+        self.canonical_uri = canonical_uri
+        self.canonical_querystring = canonical_querystring
+        self.payload_hash = payload_hash
+
+    def matches(self, r):
+        return self.body is r.body and self.url == r.url and self.method == r.method
+
+
+class SigningRequest(object):
+    """
+    Minimal, transport-neutral request that AWSSigV4Signer can sign.
+
+    The signer only needs `method`, `url`, `body` and a mutable `headers`
+    mapping, which `requests.PreparedRequest` already provides. Adapters for
+    other HTTP clients wrap their own request objects in a SigningRequest.
+    """
+
+    def __init__(self, method, url, body=None, headers=None):
+        self.method = method
+        self.url = url
+        self.body = body
+        self.headers = headers if headers is not None else {}
+
+
+class AWSSigV4Signer(object):
+    """
+    Computes the headers of Amazon's signature version 4 signing process
+    for a request, independently of the HTTP client sending it. See
+    AWSRequestsAuth and the httpx_auth/aiohttp_auth modules for the client
+    integrations built on top of it.
+
+    Adapted from https://docs.aws.amazon.com/general/latest/gr/sigv4-signed-request-examples.html
+    """
+
+    def __init__(self,
+                 aws_access_key,
+                 aws_secret_access_key,
+                 aws_host,
+                 aws_region,
+                 aws_service,
+                 aws_token=None,
+                 signing_key_cache=None,
+                 payload_chunk_size=PAYLOAD_CHUNK_SIZE,
+                 payload_signing=None,
+                 signature_cache=None,
+                 stats=None,
+                 payload_hash_cache=None,
+                 trust_content_sha256=False,
+                 signed_headers=None,
+                 signing_clock=None):
+        """
+        Example usage for talking to an AWS Elasticsearch Service:
+
+        AWSSigV4Signer(aws_access_key='YOURKEY',
+                       aws_secret_access_key='YOURSECRET',
+                       aws_host='search-service-foobar.us-east-1.es.amazonaws.com',
+                       aws_region='us-east-1',
+                       aws_service='es',
+                       aws_token='...')
+
+        The aws_token is optional and is used only if you are using STS
+        temporary credentials.
+
+        Derived signing keys are cached in a SigningKeyCache. Pass your own
+        signing_key_cache to share one cache between several auth instances.
+
+        File-like and generator request bodies are hashed in reads of
+        payload_chunk_size bytes, see hash_payload().
+
+        By default the whole payload is hashed before the request is sent.
+        Set payload_signing to skip that:
+            - UNSIGNED_PAYLOAD sends x-amz-content-sha256: UNSIGNED-PAYLOAD
+              and leaves the payload out of the signature (S3 only).
+            - STREAMING_PAYLOAD sends the body with the aws-chunked encoding,
+              signing every payload_chunk_size chunk as it is uploaded (S3 only).
+
+        Pass a SignatureCache as signature_cache to reuse the signature of
+        identical requests signed within the same second.
+
+        Pass a stats.SigningStats as stats to record the time spent in each
+        phase of signing, the bytes hashed and the cache hit rates.
+
+        Payloads that were already hashed are not hashed again:
+            - with trust_content_sha256, a sha256 hex digest already set in
+              the x-amz-content-sha256 header of the request is signed as-is.
+              It must be the hash of the body, or AWS rejects the request.
+            - pass a PayloadHashCache as payload_hash_cache to reuse the hash
+              of bytes and str bodies sent again, e.g. by retries, or put()
+              there by the caller. It keeps the cached bodies alive, see
+              its maxsize and max_bytes.
+
+        Only host, x-amz-date, x-amz-security-token and the headers
+        required by payload_signing are signed by default. Pass a list of
+        header names as signed_headers to sign those of the request too.
+        Names ending with * select every header starting with them, e.g.
+        ['content-type', 'content-md5', 'x-amz-*']. Selecting
+        x-amz-content-sha256 also signs the payload hash.
+
+        Requests are signed at the time of signing_clock, a SigningClock of
+        its own by default. Share one between signers to have them all
+        learn the offset of the host's clock at once.
+        """
+        self.aws_access_key = aws_access_key
+        self.aws_secret_access_key = aws_secret_access_key
+        self.aws_host = aws_host
+        self.aws_region = aws_region
+        self.service = aws_service
+        self.aws_token = aws_token
+        self.signing_context = SigningContext(aws_host, aws_region, aws_service)
+        self.signing_key_cache = signing_key_cache if signing_key_cache is not None else SigningKeyCache()
+        self.payload_chunk_size = payload_chunk_size
+        if payload_signing not in (None, UNSIGNED_PAYLOAD, STREAMING_PAYLOAD):
+            raise ValueError('payload_signing must be one of None, %r or %r, got %r'
+                             % (UNSIGNED_PAYLOAD, STREAMING_PAYLOAD, payload_signing))
+        self.payload_signing = payload_signing
+        self.signature_cache = signature_cache
+        self.stats = stats
+        self.payload_hash_cache = payload_hash_cache
+        self.trust_content_sha256 = trust_content_sha256
+        self.signed_headers = signed_headers
+        self.signing_clock = signing_clock if signing_clock is not None else SigningClock()
+        # (lowercase name, value) of headers with a fixed value signed and
+        # sent with every request, see sigv4a
+        self.fixed_signed_headers = ()
+        if signed_headers is not None:
+            selected = [name.lower() for name in signed_headers]
+            self._signed_header_names = frozenset(name for name in selected if not name.endswith('*'))
+            self._signed_header_prefixes = tuple(name[:-1] for name in selected if name.endswith('*'))
+            self._sign_content_sha256 = self._selects_header('x-amz-content-sha256')
+            self._canonical_headers_cache = {}
+
+    def get_aws_request_headers_handler(self, r):
+        """
+        Override get_aws_request_headers_handler() if you have a
+        subclass that needs to call get_aws_request_headers() with
+        an arbitrary set of AWS credentials. The default implementation
+        calls get_aws_request_headers() with the credentials returned
+        by get_aws_credentials()
+        """
+        return self.get_aws_request_headers(r=r, **self.get_aws_credentials())
+
+    def get_aws_credentials(self):
+        """
+        Returns the keyword arguments for get_aws_request_headers() holding
+        the AWS credentials to sign with. The default implementation returns
+        self.aws_access_key, self.aws_secret_access_key, and self.aws_token
+        """
+        return {
+            'aws_access_key': self.aws_access_key,
+            'aws_secret_access_key': self.aws_secret_access_key,
+            'aws_token': self.aws_token,
+        }
+
+    def credentials_refresh_needed(self):
+        """
+        Returns True if get_aws_credentials() may block on I/O to refresh
+        the credentials, so that async integrations can run it in an
+        executor. Static credentials never need a refresh.
+        """
+        return False
+
+    def get_aws_request_headers(self, r, aws_access_key, aws_secret_access_key, aws_token, window=None):
+        """
+        Returns a dictionary containing the necessary headers for Amazon's
+        signature version 4 signing process. An example return value might
+        look like
+
+            {
+                'Authorization': 'AWS4-HMAC-SHA256 Credential=YOURKEY/20160618/us-east-1/es/aws4_request, '
+                                 'SignedHeaders=host;x-amz-date, '
+                                 'Signature=ca0a856286efce2a4bd96a978ca6c8966057e53184776c0685169d08abd74739',
+                'x-amz-date': '20160618T220405Z',
+            }
+
+        `window` is the SigningWindow to sign in, the current one by default.
+        """
+        # Create a date for headers and the credential string. The strings
+        # derived from it are shared by all the requests signed in the same
+        # second, see SigningContext.
+        # with stats enabled, observations are collected here and recorded
+        # all at once when done, each phase adding up to one observation
+        stats = self.stats
+        if stats is not None:
+            observations = []
+            started = clock()
+        if window is None:
+            window = self.signing_context.at(self.signing_clock.now())
+        amzdate = window.amzdate
+
+        # Requests signed before carry the parts of their canonical request
+        # that only depend on the request itself, see CanonicalParts
+        canonical_parts = getattr(r, CANONICAL_PARTS_ATTRIBUTE, None)
+        if isinstance(canonical_parts, CanonicalParts) and canonical_parts.matches(r):
+            canonical_uri = canonical_parts.canonical_uri
+            canonical_querystring = canonical_parts.canonical_querystring
+        else:
+            canonical_parts = None
+            canonical_uri, canonical_querystring = self.get_canonical_path_and_querystring(r)
+        if stats is not None:
+            canonicalized = clock()
+            canonicalize_seconds = canonicalized - started
+
+        # Create payload hash (hash of the request body content). For GET
+        # requests, the payload is an empty string (''). File objects and
+        # generators are hashed in chunks, see hash_payload(). Unsigned and
+        # streaming payloads use a fixed marker instead of a hash. Known
+        # hashes are reused, see trust_content_sha256 and payload_hash_cache.
+        headers = {}
+        signed_payload_headers = []
+        if self.payload_signing is None:
+            payload_hash = None
+            bytes_hashed = 0
+            if canonical_parts is not None:
+                payload_hash = canonical_parts.payload_hash
+            elif self.trust_content_sha256:
+                payload_hash = _content_sha256(r.headers)
+            if payload_hash is None and self.payload_hash_cache is not None:
+                payload_hash = self.payload_hash_cache.get(r.body)
+            if payload_hash is None:
+                payload_hash, body, bytes_hashed = _hash_payload(r.body, self.payload_chunk_size)
+                if body is not r.body:
+                    r.body = body
+                elif self.payload_hash_cache is not None:
+                    self.payload_hash_cache.put(body, payload_hash)
+            if stats is not None:
+                observations.append((HASH_PAYLOAD_SECONDS, clock() - canonicalized))
+                observations.append(('bytes_hashed', bytes_hashed))
+        else:
+            payload_hash = self.payload_signing
+            signed_payload_headers.append(('x-amz-content-sha256', payload_hash))
+        if self.payload_signing == STREAMING_PAYLOAD:
+            decoded_length, body = _payload_length(r.body)
+            if body is not r.body:
+                r.body = body
+            content_encoding = r.headers.get('Content-Encoding')
+            headers['Content-Encoding'] = 'aws-chunked,' + content_encoding if content_encoding else 'aws-chunked'
+            headers['Content-Length'] = str(_aws_chunked_length(decoded_length, self.payload_chunk_size))
+            headers['x-amz-decoded-content-length'] = str(decoded_length)
+            signed_payload_headers.append(('x-amz-decoded-content-length', str(decoded_length)))
+            # the aws-chunked body has a known length, never send it with
+            # http's own chunked transfer encoding
+            r.headers.pop('Transfer-Encoding', None)
+        elif canonical_parts is None and (r.body is None or isinstance(r.body, IMMUTABLE_BODY_TYPES)):
+            try:
+                setattr(r, CANONICAL_PARTS_ATTRIBUTE,
+                        CanonicalParts(r.method, r.url, r.body, canonical_uri, canonical_querystring, payload_hash))
+            except AttributeError:
+                pass
+
+        if stats is not None:
+            canonicalizing = clock()
+
+        # Extra headers of the request selected by signed_headers
+        extra_header_items = ()
+        if self.signed_headers is not None:
+            extra_header_items = self.get_canonical_extra_headers(r.headers, headers)
+            if self._sign_content_sha256 and self.payload_signing is None:
+                signed_payload_headers.append(('x-amz-content-sha256', payload_hash))
+
+        # Identical requests signed within the same second get identical
+        # signatures, so the cached headers can be reused if enabled. The
+        # endpoint is part of the key, as signers may share a cache.
+        signature_cache_key = None
+        if self.signature_cache is not None and self.payload_signing != STREAMING_PAYLOAD:
+            signature_cache_key = (amzdate, self.aws_host, self.aws_region, self.service, window.algorithm,
+                                   r.method, canonical_uri, canonical_querystring, payload_hash,
+                                   aws_access_key, aws_token, extra_header_items)
+            cached_headers = self.signature_cache.get(signature_cache_key)
+            if stats is not None:
+                observations.append(('signature_cache_misses' if cached_headers is None
+                                     else 'signature_cache_hits', 1))
+            if cached_headers is not None:
+                if stats is not None:
+                    observations.append((CANONICALIZE_SECONDS, canonicalize_seconds + clock() - canonicalizing))
+                    observations.append(('requests', 1))
+                    stats.record_many(observations)
+                return cached_headers
+
+        # Create the canonical headers and signed headers. Header names
+        # and value must be trimmed and lowercase, and sorted in ASCII order.
+        # Note that there is a trailing \n.
+        #
+        # Create the list of signed headers. This lists the headers
+        # in the canonical_headers list, delimited with ";" and in alpha order.
+        # Note: The request can include any headers; canonical_headers and
+        # signed_headers lists those that you want to be included in the
+        # hash of the request. "Host" and "x-amz-date" are always required.
+        if signed_payload_headers or extra_header_items or self.fixed_signed_headers:
+            canonical_header_items = [('host', self.aws_host), ('x-amz-date', amzdate)]
+            canonical_header_items.extend(signed_payload_headers)
+            canonical_header_items.extend(extra_header_items)
+            canonical_header_items.extend(self.fixed_signed_headers)
+            if aws_token:
+                canonical_header_items.append(('x-amz-security-token', aws_token))
+            canonical_header_items.sort()
+            canonical_headers = ''.join(name + ':' + value + '\n' for name, value in canonical_header_items)
+            signed_headers = ';'.join(name for name, _ in canonical_header_items)
+        elif aws_token:
+            canonical_headers = (self.signing_context.host_header + window.date_header +
+                                 'x-amz-security-token:' + aws_token + '\n')
+            signed_headers = 'host;x-amz-date;x-amz-security-token'
+        else:
+            canonical_headers = self.signing_context.host_header + window.date_header
+            signed_headers = 'host;x-amz-date'
+
+        # Combine elements to create create canonical request
+        canonical_request = (r.method + '\n' + canonical_uri + '\n' +
+                             canonical_querystring + '\n' + canonical_headers +
+                             '\n' + signed_headers + '\n' + payload_hash)
+        if stats is not None:
+            signing = clock()
+            observations.append((CANONICALIZE_SECONDS, canonicalize_seconds + signing - canonicalizing))
+
+        # The string to sign starts with the algorithm, the date and the
+        # credential scope, see SigningWindow
+        string_to_sign = (window.string_to_sign_prefix +
+                          hashlib.sha256(canonical_request.encode('utf-8')).hexdigest())
+
+        # Create the signing key using the function defined above. The key
+        # only changes once per day, so it is served from the cache.
+        if stats is not None:
+            deriving = clock()
+            sign_seconds = deriving - signing
+        signing_key, cached = self.get_signing_key(aws_access_key, aws_secret_access_key, window)
+        if stats is not None:
+            signing = clock()
+            observations.append((DERIVE_KEY_SECONDS, signing - deriving))
+            observations.append(('signing_key_cache_hits' if cached else 'signing_key_cache_misses', 1))
+
+        # Sign the string_to_sign using the signing_key
+        signature = self.compute_signature(signing_key, string_to_sign)
+        if stats is not None:
+            observations.append((SIGN_SECONDS, sign_seconds + clock() - signing))
+
+        if self.payload_signing == STREAMING_PAYLOAD:
+            # the request signature is the seed of the chunk signature chain
+            r.body = aws_chunked(r.body, signing_key, amzdate, window.credential_scope,
+                                 signature, self.payload_chunk_size)
+
+        # The signing information can be either in a query string value or in
+        # a header named Authorization. This code shows how to use a header.
+        # Create authorization header and add to request headers
+        authorization_header = window.authorization_prefix(aws_access_key, signed_headers) + signature
+
+        headers.update({
+            'Authorization': authorization_header,
+            'x-amz-date': amzdate,
+            'x-amz-content-sha256': payload_hash
+        })
+        if aws_token:
+            headers['X-Amz-Security-Token'] = aws_token
+        headers.update(self.fixed_signed_headers)
+        if signature_cache_key is not None:
+            self.signature_cache.put(signature_cache_key, headers)
+        if stats is not None:
+            observations.append(('requests', 1))
+            stats.record_many(observations)
+        return headers
+
+    def get_signing_key(self, aws_access_key, aws_secret_access_key, window):
+        """
+        Returns a tuple of (the key to sign requests of `window` with,
+        whether it came from the signing_key_cache)
+        """
+        return self.signing_key_cache.lookup(aws_secret_access_key, window.datestamp, self.aws_region, self.service)
+
+    def compute_signature(self, signing_key, string_to_sign):
+        """
+        Returns the hex encoded signature of `string_to_sign`
+        """
+        return hmac.new(signing_key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def _selects_header(self, name):
+        return name in self._signed_header_names or name.startswith(self._signed_header_prefixes)
+
+    def get_canonical_extra_headers(self, request_headers, signer_headers):
+        """
+        Returns the canonical (name, value) items of the headers selected by
+        signed_headers, in a tuple sorted by name. `signer_headers` are the
+        headers the signer is about to set on the request, and take
+        precedence over `request_headers`.
+
+        Header names are lowercased and matched in a single pass. Requests
+        to the same endpoint mostly send the same headers, so their
+        canonical form is memoized.
+        """
+        names = self._signed_header_names
+        prefixes = self._signed_header_prefixes
+        overridden = frozenset(name.lower() for name in signer_headers)
+        selected = []
+        for headers in (request_headers, signer_headers):
+            for name, value in headers.items():
+                name = name.lower()
+                if name in SIGNER_HEADERS or not (name in names or name.startswith(prefixes)):
+                    continue
+                if headers is request_headers and name in overridden:
+                    continue
+                selected.append((name, value))
+        if not selected:
+            return ()
+
+        selected = tuple(selected)
+        cache = self._canonical_headers_cache
+        canonical = cache.get(selected)
+        if canonical is None:
+            canonical = _canonical_header_items(selected)
+            if len(cache) >= CANONICAL_HEADERS_CACHE_SIZE:
+                # most requests of a signer send the same few header sets,
+                # start over rather than track recency
+                cache.clear()
+            cache[selected] = canonical
+        return canonical
+
+    def get_presigned_url(self, url, method='GET', expires=3600):
+        """
+        Returns `url` with the signature in its query string (X-Amz-Algorithm,
+        X-Amz-Credential, X-Amz-Date, X-Amz-Expires, X-Amz-SignedHeaders and
+        X-Amz-Signature), so that it can be fetched without any credentials
+        for `expires` seconds, e.g. by a browser or a CDN.
+
+        Only the host header is signed, and the payload is not signed for S3.
+        """
+        return self.get_presigned_urls([url], method, expires)[0]
+
+    def get_presigned_urls(self, urls, method='GET', expires=3600):
+        """
+        Presigns many urls at once, see get_presigned_url(). The credentials,
+        the timestamp and the signing key are looked up once for all of them.
+        """
+        credentials = self.get_aws_credentials()
+        window = self.signing_context.at(self.signing_clock.now())
+        return [self.presign(url, method, expires, window=window, **credentials) for url in urls]
+
+    def presign(self, url, method, expires, aws_access_key, aws_secret_access_key, aws_token, window=None):
+        """
+        Presigns `url` with an arbitrary set of AWS credentials, the query
+        string counterpart of get_aws_request_headers()
+        """
+        if not 0 < expires <= MAX_PRESIGN_EXPIRES:
+            raise ValueError('expires must be between 1 and %d seconds, got %r' % (MAX_PRESIGN_EXPIRES, expires))
+        if window is None:
+            window = self.signing_context.at(self.signing_clock.now())
+
+        auth_params = [
+            ('X-Amz-Algorithm', window.algorithm),
+            ('X-Amz-Credential', aws_access_key + '/' + window.credential_scope),
+            ('X-Amz-Date', window.amzdate),
+            ('X-Amz-Expires', str(int(expires))),
+            ('X-Amz-SignedHeaders', 'host'),
+        ]
+        if aws_token:
+            auth_params.append(('X-Amz-Security-Token', aws_token))
+        for name, value in self.fixed_signed_headers:
+            auth_params.append(('-'.join(part.capitalize() for part in name.split('-')), value))
+        auth_querystring = '&'.join(key + '=' + quote(value, safe='-_.~') for key, value in auth_params)
+
+        parsedurl = urlsplit(url)
+        querystring = parsedurl.query + '&' + auth_querystring if parsedurl.query else auth_querystring
+        r = SigningRequest(method, urlunsplit(parsedurl._replace(query=querystring, fragment='')))
+
+        # S3 does not sign the payload of presigned urls, other services
+        # expect the hash of the (empty) payload of a GET
+        payload_hash = UNSIGNED_PAYLOAD if self.service == 's3' else hashlib.sha256(b'').hexdigest()
+        canonical_uri, canonical_querystring = self.get_canonical_path_and_querystring(r)
+        canonical_request = (method + '\n' + canonical_uri + '\n' + canonical_querystring + '\n' +
+                             self.signing_context.host_header + '\n' + 'host' + '\n' + payload_hash)
+        string_to_sign = (window.string_to_sign_prefix +
+                          hashlib.sha256(canonical_request.encode('utf-8')).hexdigest())
+        signing_key, _ = self.get_signing_key(aws_access_key, aws_secret_access_key, window)
+        signature = self.compute_signature(signing_key, string_to_sign)
+        return r.url + '&X-Amz-Signature=' + signature
+
+    @classmethod
+    def get_canonical_path_and_querystring(cls, r):
+        """
+        Returns the canonical URI and the canonical query string of `r`,
+        parsing its url only once. This is what get_aws_request_headers()
+        uses, see get_canonical_path() and get_canonical_querystring().
+        """
+        parsedurl = urlsplit(r.url)
+        return canonical_path(parsedurl.path), canonical_querystring(parsedurl.query)
+
+    @classmethod
+    def get_canonical_path(cls, r):
+        """
+        Create canonical URI--the part of the URI from domain to query
+        string (use '/' if no path)
+        """
+        return canonical_path(urlsplit(r.url).path)
+
+    @classmethod
+    def get_canonical_querystring(cls, r):
+        """
+        Create the canonical query string. According to AWS, by the
+        end of this function our query string keys and values must
+        be URL-encoded as per RFC 3986 (space=%20) and the parameters
+        must be sorted by key, then by value.
+
+        The query params in `r` may or may not be url encoded already:
+        they are decoded, then encoded again, so elasticsearch-py's
+        encoded params and unencoded params both sign correctly.
+        """
+        return canonical_querystring(urlsplit(r.url).query)
@@ -0,0 +1,193 @@
+"""
+Signature version 4A (SigV4A): the asymmetric, multi-region variant of
+signature version 4, needed e.g. by S3 Multi-Region Access Points.
+
+Requests are signed with an ECDSA P-256 key derived from the credentials,
+and are valid in every region of a region set. This module requires the
+cryptography package, which is not a requirement of aws-requests-auth.
+"""
+
+import binascii
+import hashlib
+import hmac
+import struct
+from collections import OrderedDict
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from .aws_auth import AWSRequestsAuth
+from .boto_utils import BotoCredentialsMixin
+from .multiprocessing_utils import ForkSafeLockMixin
+from .signing import STREAMING_PAYLOAD, AWSSigV4Signer, SigningContext, SigningKeyCache
+
+# Signing algorithm of signature version 4A
+SIGV4A_ALGORITHM = 'AWS4-ECDSA-P256-SHA256'
+
+# Order of the NIST P-256 curve
+P256_ORDER = 0xFFFFFFFF00000000FFFFFFFFFFFFFFFFBCE6FAADA7179E84F3B9CAC2FC632551
+
+
+def derive_private_key(aws_access_key, aws_secret_access_key):
+    """
+    Returns the ECDSA P-256 private key SigV4A signs with for the given
+    credentials.
+
+    The key is derived with the NIST SP 800-108 KDF in counter mode, using
+    HMAC-SHA256, as done by the AWS SDKs: candidates are derived with an
+    increasing counter until one is a valid private key.
+    """
+    input_key = ('AWS4A' + aws_secret_access_key).encode('utf-8')
+    fixed_input_prefix = b'\x00\x00\x00\x01' + SIGV4A_ALGORITHM.encode('utf-8') + b'\x00' + aws_access_key.encode('utf-8')
+    for counter in range(1, 255):
+        fixed_input = fixed_input_prefix + struct.pack('>B', counter) + struct.pack('>I', 256)
+        candidate = int(binascii.hexlify(hmac.new(input_key, fixed_input, hashlib.sha256).digest()), 16)
+        if candidate <= P256_ORDER - 2:
+            return ec.derive_private_key(candidate + 1, ec.SECP256R1())
+    raise ValueError('Could not derive a SigV4A private key from the credentials')
+
+
+class PrivateKeyCache(ForkSafeLockMixin):
+    """
+    Thread-safe, bounded cache of the SigV4A private keys derived from
+    credentials. Unlike SigV4 signing keys, they do not depend on the date,
+    so a key is derived once per credentials.
+
+    Entries are keyed on the access key and a fingerprint of the secret
+    key, and the least recently used entries are evicted once `maxsize` is
+    exceeded. Keys can not be pickled, they are derived again when needed.
+    """
+
+    # private key objects can not be pickled
+    _process_local_attributes = ('_lock', '_keys')
+
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._keys = OrderedDict()
+        self._init_lock()
+
+    def _reinit_process_local(self):
+        super(PrivateKeyCache, self)._reinit_process_local()
+        if '_keys' not in self.__dict__:
+            self._keys = OrderedDict()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def lookup(self, aws_access_key, aws_secret_access_key):
+        """
+        Returns a tuple of (the private key of the credentials, whether it
+        was cached), deriving and caching it on a miss
+        """
+        cache_key = (aws_access_key, SigningKeyCache.fingerprint(aws_secret_access_key))
+        with self._lock:
+            private_key = self._keys.pop(cache_key, None)
+            if private_key is not None:
+                # re-insert to mark the entry as most recently used
+                self._keys[cache_key] = private_key
+                self.hits += 1
+                return private_key, True
+            self.misses += 1
+
+        private_key = derive_private_key(aws_access_key, aws_secret_access_key)
+        with self._lock:
+            self._keys[cache_key] = private_key
+            while len(self._keys) > self.maxsize:
+                self._keys.popitem(last=False)
+        return private_key, False
+
+    def invalidate(self, aws_secret_access_key):
+        """
+        Drops every cached key derived from `aws_secret_access_key`, e.g.
+        after the credentials have been rotated
+        """
+        fingerprint = SigningKeyCache.fingerprint(aws_secret_access_key)
+        with self._lock:
+            for stale_key in [k for k in self._keys if k[1] == fingerprint]:
+                del self._keys[stale_key]
+
+    def clear(self):
+        """
+        Drops every cached key and resets the hit/miss counters
+        """
+        with self._lock:
+            self._keys.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class AWSSigV4ASigner(AWSSigV4Signer):
+    """
+    AWSSigV4Signer signing with signature version 4A.
+
+    `aws_region` is the region set the signature is valid in: a region, a
+    list of regions, or '*' for all of them. It is sent in the
+    X-Amz-Region-Set header, and left out of the credential scope.
+
+    The signing_key_cache is a PrivateKeyCache. ECDSA signatures are
+    randomized, so signing the same request twice gives two different,
+    equally valid, signatures. The aws-chunked STREAMING_PAYLOAD is not
+    supported.
+    """
+
+    def __init__(self,
+                 aws_access_key,
+                 aws_secret_access_key,
+                 aws_host,
+                 aws_region,
+                 aws_service,
+                 aws_token=None,
+                 signing_key_cache=None,
+                 **kwargs):
+        if kwargs.get('payload_signing') == STREAMING_PAYLOAD:
+            raise ValueError('STREAMING_PAYLOAD is not supported with SigV4A')
+        if not hasattr(aws_region, 'split'):
+            aws_region = ','.join(aws_region)
+        super(AWSSigV4ASigner, self).__init__(aws_access_key,
+                                              aws_secret_access_key,
+                                              aws_host,
+                                              aws_region,
+                                              aws_service,
+                                              aws_token=aws_token,
+                                              signing_key_cache=(signing_key_cache if signing_key_cache is not None
+                                                                 else PrivateKeyCache()),
+                                              **kwargs)
+        self.signing_context = SigningContext(aws_host, aws_region, aws_service,
+                                              algorithm=SIGV4A_ALGORITHM,
+                                              scope_suffix='/' + aws_service + '/aws4_request')
+        self.fixed_signed_headers = (('x-amz-region-set', aws_region),)
+
+    def get_signing_key(self, aws_access_key, aws_secret_access_key, window):
+        return self.signing_key_cache.lookup(aws_access_key, aws_secret_access_key)
+
+    def compute_signature(self, signing_key, string_to_sign):
+        signature = signing_key.sign(string_to_sign.encode('utf-8'), ec.ECDSA(hashes.SHA256()))
+        return binascii.hexlify(signature).decode('ascii')
+
+
+class AWSSigV4ARequestsAuth(AWSSigV4ASigner, AWSRequestsAuth):
+    """
+    AWSRequestsAuth signing with signature version 4A. Example usage for an
+    S3 Multi-Region Access Point:
+
+    AWSSigV4ARequestsAuth(aws_access_key='YOURKEY',
+                          aws_secret_access_key='YOURSECRET',
+                          aws_host='mfzwi23gnjvgw.mrap.accesspoint.s3-global.amazonaws.com',
+                          aws_region='*',
+                          aws_service='s3',
+                          signed_headers=['x-amz-content-sha256'])
+    """
+
+
+class BotoAWSSigV4ARequestsAuth(BotoCredentialsMixin, AWSSigV4ARequestsAuth):
+    """
+    AWSSigV4ARequestsAuth signing with the credentials botocore discovers,
+    see boto_utils.BotoAWSRequestsAuth
+    """
+
+    def __init__(self, aws_host, aws_region, aws_service, background_refresh_interval=None,
+                 shared_credentials=None, **kwargs):
+        super(BotoAWSSigV4ARequestsAuth, self).__init__(None, None, aws_host, aws_region, aws_service, **kwargs)
+        self._init_boto_credentials(background_refresh_interval, shared_credentials)
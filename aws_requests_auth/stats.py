@@ -0,0 +1,113 @@
+"""
+Optional instrumentation of the signing hot path.
+
+Pass a SigningStats as the `stats` keyword argument of an auth class to
+record where the time spent signing goes. Without one, signing only pays
+for a few `is not None` checks.
+"""
+
+from .multiprocessing_utils import ForkSafeLockMixin
+
+try:
+    from time import perf_counter as clock
+except ImportError:
+    # python 2
+    from time import time as clock
+
+# Phases of signing a request, timed separately
+CANONICALIZE = 'canonicalize'
+HASH_PAYLOAD = 'hash_payload'
+DERIVE_KEY = 'derive_key'
+SIGN = 'sign'
+PHASES = (CANONICALIZE, HASH_PAYLOAD, DERIVE_KEY, SIGN)
+
+CANONICALIZE_SECONDS = CANONICALIZE + '_seconds'
+HASH_PAYLOAD_SECONDS = HASH_PAYLOAD + '_seconds'
+DERIVE_KEY_SECONDS = DERIVE_KEY + '_seconds'
+SIGN_SECONDS = SIGN + '_seconds'
+
+
+class SigningStats(ForkSafeLockMixin):
+    """
+    Thread-safe counters and cumulative timings of the signing process:
+
+        - requests: number of requests signed
+        - <phase>_seconds: time spent in each of PHASES
+        - bytes_hashed: payload bytes run through sha256
+        - signing_key_cache_hits/misses: signing key lookups
+        - signature_cache_hits/misses: lookups in the signature_cache, if any
+        - credentials_refreshes, credentials_refresh_seconds: inline
+          credential refreshes signing had to wait for (botocore signers)
+
+    snapshot() returns them as a flat dict, ready to be exported as gauges
+    or counters, e.g. from a Prometheus collector or a periodic StatsD flush.
+
+    To feed histograms instead, pass a `listener`: a callable taking a
+    metric name and a value, called with every single observation, e.g.
+    ('hash_payload_seconds', 0.0012) or ('bytes_hashed', 1048576). Cache
+    lookups are reported as ('signing_key_cache_hits', 1) or
+    ('signing_key_cache_misses', 1). Each metric is reported at most once
+    per request signed, so phase timings can be fed to histograms as they
+    are. The listener runs on the signing thread, so it should be fast and
+    must not raise.
+    """
+
+    def __init__(self, listener=None):
+        self.listener = listener
+        self._init_lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Sets every counter and timing back to zero
+        """
+        with self._lock:
+            self._values = dict.fromkeys(self.metric_names(), 0)
+
+    @staticmethod
+    def metric_names():
+        """
+        Returns the names of the metrics recorded, see the class docstring
+        """
+        return (('requests',) +
+                tuple(phase + '_seconds' for phase in PHASES) +
+                ('bytes_hashed',
+                 'signing_key_cache_hits',
+                 'signing_key_cache_misses',
+                 'signature_cache_hits',
+                 'signature_cache_misses',
+                 'credentials_refreshes',
+                 'credentials_refresh_seconds'))
+
+    def record(self, metric, value=1):
+        """
+        Adds `value` to `metric`, and reports it to the listener
+        """
+        self.record_many(((metric, value),))
+
+    def record_many(self, observations):
+        """
+        record() for a sequence of (metric, value) tuples, e.g. all the
+        observations made while signing one request
+        """
+        with self._lock:
+            values = self._values
+            for metric, value in observations:
+                values[metric] += value
+        listener = self.listener
+        if listener is not None:
+            for metric, value in observations:
+                listener(metric, value)
+
+    def snapshot(self):
+        """
+        Returns a copy of the current values, as a dict of metric name to
+        value, plus the signing_key_cache_hit_rate and
+        signature_cache_hit_rate ratios (None until the first lookup)
+        """
+        with self._lock:
+            values = dict(self._values)
+        for cache in ('signing_key_cache', 'signature_cache'):
+            lookups = values[cache + '_hits'] + values[cache + '_misses']
+            values[cache + '_hit_rate'] = float(values[cache + '_hits']) / lookups if lookups else None
+        return values
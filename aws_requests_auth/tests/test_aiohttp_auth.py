@@ -0,0 +1,53 @@
+import datetime
+import sys
+import unittest
+
+import mock
+
+from aws_requests_auth.signing import AWSSigV4Signer
+
+try:
+    import asyncio
+    from aiohttp import ClientSession, web
+    from aiohttp.test_utils import TestServer
+    from aws_requests_auth.aiohttp_auth import AWSAiohttpMiddleware
+except ImportError:
+    web = None
+
+
+@unittest.skipIf(web is None, 'aiohttp is not installed')
+@unittest.skipIf(sys.version_info < (3, 7), 'asyncio.run requires python 3.7+')
+class TestAWSAiohttpMiddleware(unittest.TestCase):
+    """
+    Tests for AWSAiohttpMiddleware
+    """
+
+    def test_post(self):
+        signer = AWSSigV4Signer(aws_access_key='YOURKEY',
+                                aws_secret_access_key='YOURSECRET',
+                                aws_host='search-foo.us-east-1.es.amazonaws.com',
+                                aws_region='us-east-1',
+                                aws_service='es')
+        received_headers = []
+
+        async def handler(request):
+            received_headers.append(request.headers)
+            return web.Response()
+
+        async def post():
+            app = web.Application()
+            app.router.add_post('/', handler)
+            async with TestServer(app) as server:
+                async with ClientSession(middlewares=[AWSAiohttpMiddleware(signer)]) as session:
+                    async with session.post(server.make_url('/'), data=b'foo=bar') as response:
+                        self.assertEqual(200, response.status)
+
+        frozen_datetime = datetime.datetime(2016, 6, 18, 22, 4, 5)
+        with mock.patch('datetime.datetime') as mock_datetime:
+            mock_datetime.utcnow.return_value = frozen_datetime
+            asyncio.run(post())
+        self.assertEqual('AWS4-HMAC-SHA256 Credential=YOURKEY/20160618/us-east-1/es/aws4_request, '
+                         'SignedHeaders=host;x-amz-date, '
+                         'Signature=a6fd88e5f5c43e005482894001d9b05b43f6710e96be6098bcfcfccdeb8ed812',
+                         received_headers[0]['Authorization'])
+        self.assertEqual('20160618T220405Z', received_headers[0]['x-amz-date'])
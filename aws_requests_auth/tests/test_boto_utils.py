@@ -1,11 +1,13 @@
 import datetime
 import hashlib
 import os
+import time
 import unittest
 
 import mock
 
 from aws_requests_auth.boto_utils import BotoAWSRequestsAuth, get_credentials
+from aws_requests_auth.stats import SigningStats
 
 
 class TestBotoUtils(unittest.TestCase):
@@ -58,3 +60,81 @@ class TestBotoUtils(unittest.TestCase):
             'x-amz-content-sha256': hashlib.sha256(b'').hexdigest(),
 
         }, mock_request.headers)
+
+    def test_credential_rotation_invalidates_signing_keys(self):
+        boto_auth_inst = BotoAWSRequestsAuth(
+            aws_host='search-foo.us-east-1.es.amazonaws.com',
+            aws_region='us-east-1',
+            aws_service='es',
+        )
+        mock_request = mock.Mock()
+        mock_request.url = 'http://search-foo.us-east-1.es.amazonaws.com:80/'
+        mock_request.method = "GET"
+        mock_request.body = None
+
+        rotated_credentials = {
+            'aws_access_key': 'rotated-key',
+            'aws_secret_access_key': 'rotated-secret',
+            'aws_token': None,
+        }
+        boto_auth_inst.get_aws_request_headers_handler(mock_request)
+        self.assertEqual(1, len(boto_auth_inst.signing_key_cache))
+        with mock.patch('aws_requests_auth.boto_utils.get_credentials', return_value=rotated_credentials):
+            boto_auth_inst.get_aws_request_headers_handler(mock_request)
+        self.assertEqual(1, len(boto_auth_inst.signing_key_cache))
+        self.assertEqual(2, boto_auth_inst.signing_key_cache.misses)
+
+    def test_background_refresh(self):
+        frozen_credentials = [mock.Mock(access_key='key-1', secret_key='secret-1', token='token-1')]
+        refreshable_credentials = mock.Mock()
+        refreshable_credentials.get_frozen_credentials.side_effect = lambda: frozen_credentials[-1]
+
+        with mock.patch('aws_requests_auth.boto_utils.Session') as mock_session:
+            mock_session.return_value.get_credentials.return_value = refreshable_credentials
+            boto_auth_inst = BotoAWSRequestsAuth(
+                aws_host='search-foo.us-east-1.es.amazonaws.com',
+                aws_region='us-east-1',
+                aws_service='es',
+                background_refresh_interval=0.01,
+            )
+        self.addCleanup(boto_auth_inst.close)
+        self.assertFalse(boto_auth_inst.credentials_refresh_needed())
+        self.assertEqual('key-1', boto_auth_inst.get_aws_credentials()['aws_access_key'])
+
+        frozen_credentials.append(mock.Mock(access_key='key-2', secret_key='secret-2', token='token-2'))
+        for _ in range(100):
+            if boto_auth_inst.get_aws_credentials()['aws_access_key'] == 'key-2':
+                break
+            time.sleep(0.01)
+        self.assertEqual({
+            'aws_access_key': 'key-2',
+            'aws_secret_access_key': 'secret-2',
+            'aws_token': 'token-2',
+        }, boto_auth_inst.get_aws_credentials())
+
+        # once closed, credentials are fetched from botocore inline again
+        calls = refreshable_credentials.get_frozen_credentials.call_count
+        boto_auth_inst.close()
+        self.assertEqual('key-2', boto_auth_inst.get_aws_credentials()['aws_access_key'])
+        self.assertGreater(refreshable_credentials.get_frozen_credentials.call_count, calls)
+
+    def test_stats_record_inline_refresh(self):
+        refreshable_credentials = mock.Mock()
+        refreshable_credentials.get_frozen_credentials.return_value = mock.Mock(
+            access_key='key', secret_key='secret', token=None)
+        refreshable_credentials.refresh_needed.return_value = True
+
+        stats = SigningStats()
+        with mock.patch('aws_requests_auth.boto_utils.Session') as mock_session:
+            mock_session.return_value.get_credentials.return_value = refreshable_credentials
+            boto_auth_inst = BotoAWSRequestsAuth(
+                aws_host='search-foo.us-east-1.es.amazonaws.com',
+                aws_region='us-east-1',
+                aws_service='es',
+                stats=stats,
+            )
+        boto_auth_inst.get_aws_credentials()
+        refreshable_credentials.refresh_needed.return_value = False
+        boto_auth_inst.get_aws_credentials()
+        self.assertEqual(1, stats.snapshot()['credentials_refreshes'])
+        self.assertGreaterEqual(stats.snapshot()['credentials_refresh_seconds'], 0)
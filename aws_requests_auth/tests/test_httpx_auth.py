@@ -0,0 +1,84 @@
+import datetime
+import sys
+import threading
+import time
+import unittest
+
+import mock
+
+from aws_requests_auth.signing import AWSSigV4Signer
+
+try:
+    import asyncio
+    import httpx
+    from aws_requests_auth.httpx_auth import AWSHttpxAuth
+except ImportError:
+    httpx = None
+
+
+EXPECTED_POST_AUTHORIZATION = ('AWS4-HMAC-SHA256 Credential=YOURKEY/20160618/us-east-1/es/aws4_request, '
+                               'SignedHeaders=host;x-amz-date, '
+                               'Signature=a6fd88e5f5c43e005482894001d9b05b43f6710e96be6098bcfcfccdeb8ed812')
+
+
+@unittest.skipIf(httpx is None, 'httpx is not installed')
+@unittest.skipIf(sys.version_info < (3, 7), 'asyncio.run requires python 3.7+')
+class TestAWSHttpxAuth(unittest.TestCase):
+    """
+    Tests for AWSHttpxAuth
+    """
+
+    def setUp(self):
+        self.signer = AWSSigV4Signer(aws_access_key='YOURKEY',
+                                     aws_secret_access_key='YOURSECRET',
+                                     aws_host='search-foo.us-east-1.es.amazonaws.com',
+                                     aws_region='us-east-1',
+                                     aws_service='es')
+        self.sent_requests = []
+
+    def _handler(self, request):
+        self.sent_requests.append(request)
+        return httpx.Response(200)
+
+    def test_sync_client(self):
+        client = httpx.Client(auth=AWSHttpxAuth(self.signer), transport=httpx.MockTransport(self._handler))
+        frozen_datetime = datetime.datetime(2016, 6, 18, 22, 4, 5)
+        with mock.patch('datetime.datetime') as mock_datetime:
+            mock_datetime.utcnow.return_value = frozen_datetime
+            client.post('http://search-foo.us-east-1.es.amazonaws.com:80/', content=b'foo=bar')
+        self.assertEqual(EXPECTED_POST_AUTHORIZATION, self.sent_requests[0].headers['Authorization'])
+        self.assertEqual('20160618T220405Z', self.sent_requests[0].headers['x-amz-date'])
+
+    def test_async_client(self):
+        async def post():
+            async with httpx.AsyncClient(auth=AWSHttpxAuth(self.signer),
+                                         transport=httpx.MockTransport(self._handler)) as client:
+                await client.post('http://search-foo.us-east-1.es.amazonaws.com:80/', content=b'foo=bar')
+
+        frozen_datetime = datetime.datetime(2016, 6, 18, 22, 4, 5)
+        with mock.patch('datetime.datetime') as mock_datetime:
+            mock_datetime.utcnow.return_value = frozen_datetime
+            asyncio.run(post())
+        self.assertEqual(EXPECTED_POST_AUTHORIZATION, self.sent_requests[0].headers['Authorization'])
+
+    def test_concurrent_requests_share_one_credential_refresh(self):
+        refreshes = []
+        expired = [True]
+
+        def get_aws_credentials():
+            if expired[0]:
+                refreshes.append(threading.current_thread())
+                time.sleep(0.05)
+                expired[0] = False
+            return {'aws_access_key': 'YOURKEY', 'aws_secret_access_key': 'YOURSECRET', 'aws_token': None}
+
+        self.signer.credentials_refresh_needed = lambda: expired[0]
+        self.signer.get_aws_credentials = get_aws_credentials
+        auth = AWSHttpxAuth(self.signer)
+
+        async def get_many():
+            return await asyncio.gather(*[auth.get_aws_credentials_async() for _ in range(10)])
+
+        self.assertEqual(10, len(asyncio.run(get_many())))
+        self.assertEqual(1, len(refreshes))
+        self.assertIsNot(threading.main_thread(), refreshes[0])
@@ -0,0 +1,129 @@
+import datetime
+import multiprocessing
+import os
+import pickle
+import unittest
+
+import mock
+import requests
+
+from aws_requests_auth.aws_auth import AWSRequestsAuth
+from aws_requests_auth.boto_utils import BotoAWSRequestsAuth
+from aws_requests_auth.multiprocessing_utils import SharedCredentials
+from aws_requests_auth.routing import AWSRoutingAuth
+
+try:
+    fork_context = multiprocessing.get_context('fork')
+except (AttributeError, ValueError):
+    fork_context = None
+
+
+def make_boto_auth(access_key='key-1', **kwargs):
+    refreshable_credentials = mock.Mock()
+    refreshable_credentials.get_frozen_credentials.return_value = mock.Mock(
+        access_key=access_key, secret_key='secret', token='token')
+    refreshable_credentials.refresh_needed.return_value = False
+    with mock.patch('aws_requests_auth.boto_utils.Session') as mock_session:
+        mock_session.return_value.get_credentials.return_value = refreshable_credentials
+        return BotoAWSRequestsAuth(aws_host='search-foo.us-east-1.es.amazonaws.com',
+                                   aws_region='us-east-1',
+                                   aws_service='es',
+                                   **kwargs)
+
+
+def prepare():
+    return requests.Request('GET', 'https://search-foo.us-east-1.es.amazonaws.com/').prepare()
+
+
+def run_in_child(target, *args):
+    """
+    Runs `target` in a forked child process and returns its return value
+    """
+    parent_conn, child_conn = fork_context.Pipe()
+
+    def run():
+        child_conn.send(target(*args))
+
+    process = fork_context.Process(target=run)
+    process.start()
+    try:
+        if not parent_conn.poll(10):
+            raise AssertionError('the child process is stuck')
+        return parent_conn.recv()
+    finally:
+        process.join(10)
+
+
+class TestSharedCredentials(unittest.TestCase):
+
+    def test_publish_and_read(self):
+        shared_credentials = SharedCredentials(size=256)
+        self.assertIsNone(shared_credentials.read())
+        credentials = {'aws_access_key': 'key', 'aws_secret_access_key': 'secret', 'aws_token': None}
+        shared_credentials.publish(credentials)
+        self.assertEqual(1, shared_credentials.version)
+        self.assertEqual(credentials, shared_credentials.read())
+        # decoded once per version
+        self.assertIs(shared_credentials.read(), shared_credentials.read())
+
+        with self.assertRaises(ValueError):
+            shared_credentials.publish(dict(credentials, aws_token='x' * 256))
+
+    def test_pickled_auth_signs_like_the_original(self):
+        auth = AWSRequestsAuth(aws_access_key='YOURKEY',
+                               aws_secret_access_key='YOURSECRET',
+                               aws_host='search-foo.us-east-1.es.amazonaws.com',
+                               aws_region='us-east-1',
+                               aws_service='es')
+        auth(prepare())
+        copy = pickle.loads(pickle.dumps(auth))
+        self.assertEqual(1, len(copy.signing_key_cache))
+        frozen_datetime = datetime.datetime(2016, 6, 18, 22, 4, 5)
+        with mock.patch('datetime.datetime') as mock_datetime:
+            mock_datetime.utcnow.return_value = frozen_datetime
+            self.assertEqual(auth(prepare()).headers, copy(prepare()).headers)
+
+    def test_pickled_routing_auth(self):
+        auth = AWSRoutingAuth(aws_access_key='YOURKEY', aws_secret_access_key='YOURSECRET')
+        auth(prepare())
+        copy = pickle.loads(pickle.dumps(auth))
+        self.assertEqual(0, len(copy._signers))
+        self.assertIn('Authorization', copy(prepare()).headers)
+
+    def test_pickled_boto_auth_discovers_credentials_on_first_use(self):
+        copy = pickle.loads(pickle.dumps(make_boto_auth()))
+        self.assertTrue(copy.credentials_refresh_needed())
+        with mock.patch('aws_requests_auth.boto_utils.Session') as mock_session:
+            mock_session.return_value.get_credentials.return_value.get_frozen_credentials.return_value = mock.Mock(
+                access_key='key-2', secret_key='secret', token=None)
+            self.assertEqual('key-2', copy.get_aws_credentials()['aws_access_key'])
+        mock_session.assert_called_once_with()
+
+    @unittest.skipIf(fork_context is None, 'os.fork() is not available')
+    def test_forked_children_read_shared_credentials(self):
+        shared_credentials = SharedCredentials()
+        auth = make_boto_auth(shared_credentials=shared_credentials, background_refresh_interval=3600)
+        self.addCleanup(auth.close)
+        self.assertEqual('key-1', shared_credentials.read()['aws_access_key'])
+
+        # the parent refreshes, the children read what was published last
+        auth._refreshable_credentials.get_frozen_credentials.return_value = mock.Mock(
+            access_key='key-2', secret_key='secret', token='token')
+        auth.refresh_credentials()
+        credentials, refresh_needed = run_in_child(
+            lambda: (auth.get_aws_credentials(), auth.credentials_refresh_needed()))
+        self.assertEqual({'aws_access_key': 'key-2', 'aws_secret_access_key': 'secret', 'aws_token': 'token'},
+                         credentials)
+        self.assertFalse(refresh_needed)
+
+    def test_shared_credentials_need_a_background_refresh(self):
+        with self.assertRaises(ValueError):
+            make_boto_auth(shared_credentials=SharedCredentials())
+
+    @unittest.skipIf(fork_context is None or not hasattr(os, 'register_at_fork'),
+                     'os.register_at_fork() is not available')
+    def test_locks_held_while_forking_are_replaced(self):
+        auth = make_boto_auth()
+        with auth.signing_key_cache._lock:
+            headers = run_in_child(lambda: dict(auth(prepare()).headers))
+        self.assertIn('Authorization', headers)
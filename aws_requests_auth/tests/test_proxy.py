@@ -0,0 +1,158 @@
+import json
+import sys
+import threading
+import unittest
+
+try:
+    # python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import mock
+import requests
+
+from aws_requests_auth.aws_auth import AWSRequestsAuth
+from aws_requests_auth.signing import PAYLOAD_SPOOL_SIZE
+from aws_requests_auth.stats import SigningStats
+from aws_requests_auth.verifier import AWSSigV4Verifier, SignatureError
+
+try:
+    from aws_requests_auth.proxy import STATS_PATH, ChunkedReader, SigningProxyServer, main
+except ImportError:
+    # python < 3.7, without http.server.ThreadingHTTPServer
+    SigningProxyServer = None
+
+
+class VerifyingHandler(BaseHTTPRequestHandler):
+    """
+    Stands in for an AWS endpoint: answers 403 to requests that are not
+    properly signed, and echoes the body of the others
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def _handle(self):
+        if 'chunked' in self.headers.get('Transfer-Encoding', ''):
+            body = b''.join(ChunkedReader(self.rfile))
+        else:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            self.server.verifier.verify(self.command, self.path, self.headers, body)
+            status, body = 200, body or b'{"ok": true}'
+        except SignatureError as e:
+            status, body = 403, e.code.encode('utf-8')
+        self.server.received.append(body)
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = _handle
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(server):
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,))
+    thread.daemon = True
+    thread.start()
+
+
+@unittest.skipIf(sys.version_info < (3, 7), 'the signing proxy requires python 3.7+')
+class TestSigningProxy(unittest.TestCase):
+    """
+    Tests for SigningProxyServer
+    """
+
+    def setUp(self):
+        self.upstream = HTTPServer(('127.0.0.1', 0), VerifyingHandler)
+        self.upstream.verifier = AWSSigV4Verifier({'YOURKEY': 'YOURSECRET'})
+        self.upstream.received = []
+        serve(self.upstream)
+        self.addCleanup(self.upstream.server_close)
+        self.addCleanup(self.upstream.shutdown)
+
+        upstream_host = '127.0.0.1:%d' % self.upstream.server_port
+        auth = AWSRequestsAuth(aws_access_key='YOURKEY',
+                               aws_secret_access_key='YOURSECRET',
+                               aws_host=upstream_host,
+                               aws_region='us-east-1',
+                               aws_service='es',
+                               stats=SigningStats())
+        self.proxy = SigningProxyServer(('127.0.0.1', 0), 'http://' + upstream_host, auth,
+                                        concurrency=4, max_retries=0)
+        serve(self.proxy)
+        self.addCleanup(self.proxy.server_close)
+        self.addCleanup(self.proxy.shutdown)
+        self.url = 'http://127.0.0.1:%d' % self.proxy.server_port
+        self.client = requests.Session()
+        self.addCleanup(self.client.close)
+
+    def test_get(self):
+        for _ in range(3):
+            response = self.client.get(self.url + '/_cluster/health?pretty')
+            self.assertEqual(200, response.status_code)
+            self.assertEqual({'ok': True}, response.json())
+        self.assertEqual(1, self.proxy.session.get_adapter(self.proxy.endpoint).connection_stats()['connections_opened'])
+
+    def test_upstream_error(self):
+        self.upstream.verifier = AWSSigV4Verifier({'YOURKEY': 'OTHERSECRET'})
+        for _ in range(2):
+            response = self.client.get(self.url + '/_cluster/health', timeout=5)
+            self.assertEqual(403, response.status_code)
+            self.assertEqual(b'SignatureDoesNotMatch', response.content)
+
+    def test_large_body_is_streamed(self):
+        body = b'{"index": {}}\n' * (PAYLOAD_SPOOL_SIZE // 14 + 1000)
+        response = self.client.post(self.url + '/_bulk', data=body)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(body, response.content)
+
+    def test_chunked_body(self):
+        response = self.client.put(self.url + '/index/_doc/1', data=iter([b'{"foo":', b' "bar"}']))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(b'{"foo": "bar"}', response.content)
+
+    def test_stats(self):
+        self.client.post(self.url + '/_bulk', data=b'foo=bar')
+        stats = self.client.get(self.url + STATS_PATH).json()
+        self.assertEqual(1, stats['proxy']['requests'])
+        self.assertEqual(7, stats['proxy']['bytes_received'])
+        self.assertEqual(7, stats['proxy']['bytes_sent'])
+        self.assertIsNotNone(stats['proxy']['latency_p99_seconds'])
+        self.assertEqual(1, stats['signing']['requests'])
+        self.assertEqual(1, stats['connections']['requests'])
+
+    def test_upstream_down(self):
+        self.proxy.endpoint = 'http://127.0.0.1:1'
+        response = self.client.get(self.url + '/')
+        self.assertEqual(502, response.status_code)
+        self.assertEqual(1, self.proxy.stats.snapshot()['upstream_errors'])
+
+
+@unittest.skipIf(sys.version_info < (3, 7), 'the signing proxy requires python 3.7+')
+class TestMain(unittest.TestCase):
+    """
+    Tests for the aws-sigv4-proxy entry point
+    """
+
+    @mock.patch('aws_requests_auth.proxy.SigningProxyServer')
+    @mock.patch('aws_requests_auth.boto_utils.BotoAWSRequestsAuth')
+    def test_region_and_service_from_endpoint(self, mock_auth, mock_server):
+        mock_server.return_value.server_address = ('127.0.0.1', 8080)
+        mock_server.return_value.serve_forever.side_effect = KeyboardInterrupt
+        with mock.patch('aws_requests_auth.proxy.print', create=True):
+            main(['https://search-foo.us-east-1.es.amazonaws.com', '--concurrency', '8'])
+        self.assertEqual(('search-foo.us-east-1.es.amazonaws.com', 'us-east-1', 'es'),
+                         (mock_auth.call_args[1]['aws_host'], mock_auth.call_args[1]['aws_region'],
+                          mock_auth.call_args[1]['aws_service']))
+        self.assertEqual(8, mock_server.call_args[1]['concurrency'])
+        mock_server.return_value.server_close.assert_called_once_with()
+        mock_auth.return_value.close.assert_called_once_with()
+
+    def test_unknown_endpoint(self):
+        with mock.patch('sys.stderr'):
+            with self.assertRaises(SystemExit):
+                main(['https://search.internal.example.com'])
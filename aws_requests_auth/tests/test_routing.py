@@ -0,0 +1,94 @@
+import datetime
+import unittest
+
+import mock
+
+from aws_requests_auth.aws_auth import AWSRequestsAuth
+from aws_requests_auth.routing import AWSRoutingAuth, parse_aws_hostname
+
+
+class TestParseAWSHostname(unittest.TestCase):
+    """
+    Tests for parse_aws_hostname
+    """
+
+    def test_standard_hostnames(self):
+        for hostname, endpoint in (
+            ('search-foo-abc123.us-east-1.es.amazonaws.com', ('us-east-1', 'es')),
+            ('vpc-foo-abc123.eu-west-1.es.amazonaws.com', ('eu-west-1', 'es')),
+            ('abc123.us-west-2.aoss.amazonaws.com', ('us-west-2', 'aoss')),
+            ('examplebucket.s3.eu-west-1.amazonaws.com', ('eu-west-1', 's3')),
+            ('examplebucket.s3-eu-west-1.amazonaws.com', ('eu-west-1', 's3')),
+            ('examplebucket.s3.amazonaws.com', ('us-east-1', 's3')),
+            ('s3.dualstack.ap-southeast-2.amazonaws.com', ('ap-southeast-2', 's3')),
+            ('abc123.execute-api.us-gov-west-1.amazonaws.com', ('us-gov-west-1', 'execute-api')),
+            ('sqs-fips.us-east-2.amazonaws.com', ('us-east-2', 'sqs')),
+            ('sts.amazonaws.com', ('us-east-1', 'sts')),
+            ('search-foo.cn-north-1.es.amazonaws.com.cn', ('cn-north-1', 'es')),
+        ):
+            self.assertEqual(endpoint, parse_aws_hostname(hostname), hostname)
+
+    def test_other_hostnames(self):
+        self.assertIsNone(parse_aws_hostname('search.example.com'))
+        self.assertIsNone(parse_aws_hostname('us-east-1.amazonaws.com'))
+
+
+class TestAWSRoutingAuth(unittest.TestCase):
+    """
+    Tests for AWSRoutingAuth
+    """
+
+    def setUp(self):
+        self.auth = AWSRoutingAuth(aws_access_key='YOURKEY',
+                                   aws_secret_access_key='YOURSECRET',
+                                   endpoints={'search.example.com': ('us-east-1', 'es')},
+                                   rules=[lambda hostname: ('eu-west-1', 's3') if hostname.endswith('.storage') else None],
+                                   max_endpoints=2)
+
+    def _sign(self, auth, url):
+        mock_request = mock.Mock()
+        mock_request.url = url
+        mock_request.method = "GET"
+        mock_request.body = None
+        mock_request.headers = {}
+        frozen_datetime = datetime.datetime(2016, 6, 18, 22, 4, 5)
+        with mock.patch('datetime.datetime') as mock_datetime:
+            mock_datetime.utcnow.return_value = frozen_datetime
+            auth(mock_request)
+        return mock_request.headers
+
+    def test_signs_like_a_single_endpoint_auth(self):
+        single_endpoint_auth = AWSRequestsAuth(aws_access_key='YOURKEY',
+                                               aws_secret_access_key='YOURSECRET',
+                                               aws_host='search-foo.us-east-1.es.amazonaws.com',
+                                               aws_region='us-east-1',
+                                               aws_service='es')
+        url = 'http://search-foo.us-east-1.es.amazonaws.com:80/'
+        self.assertEqual(self._sign(single_endpoint_auth, url), self._sign(self.auth, url))
+
+    def test_endpoints_and_rules(self):
+        self.assertEqual(('us-east-1', 'es'), self.auth.resolve_endpoint('search.example.com'))
+        self.assertEqual(('eu-west-1', 's3'), self.auth.resolve_endpoint('bucket.storage'))
+        with self.assertRaises(ValueError):
+            self.auth.resolve_endpoint('bucket.example.com')
+
+    def test_signer_per_endpoint(self):
+        signer = self.auth.get_signer('https://search.example.com/_search?q=foo')
+        self.assertIs(signer, self.auth.get_signer('https://search.example.com/other'))
+        self.assertEqual('search.example.com', signer.aws_host)
+        self.assertEqual('search.example.com:9200', self.auth.get_signer('https://search.example.com:9200/').aws_host)
+
+        # the least recently used endpoint is evicted
+        self.auth.get_signer('https://bucket.storage/')
+        self.assertIsNot(signer, self.auth.get_signer('https://search.example.com/'))
+
+    def test_shared_signing_key_cache(self):
+        self._sign(self.auth, 'https://search-foo.us-east-1.es.amazonaws.com/')
+        self._sign(self.auth, 'https://search-bar.us-east-1.es.amazonaws.com/')
+        self.assertEqual((1, 1), (self.auth.signing_key_cache.hits, self.auth.signing_key_cache.misses))
+
+    def test_shared_signing_clock(self):
+        self.auth.signing_clock.offset = datetime.timedelta(minutes=10)
+        self.assertIs(self.auth.signing_clock, self.auth.get_signer('https://search.example.com/').signing_clock)
+        headers = self._sign(self.auth, 'https://bucket.storage/')
+        self.assertEqual('20160618T221405Z', headers['x-amz-date'])
@@ -0,0 +1,126 @@
+import threading
+import unittest
+
+try:
+    # python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from aws_requests_auth.aws_auth import AWSRequestsAuth
+from aws_requests_auth.session import Retry, signed_session
+from aws_requests_auth.stats import SigningStats
+
+
+class ThrottlingHandler(BaseHTTPRequestHandler):
+    """
+    Keeps connections alive, and answers `throttle_status` to the first
+    `throttled` requests
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.do_POST()
+
+    def do_POST(self):
+        server = self.server
+        server.received.append(dict(self.headers))
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        status = server.throttle_status if len(server.received) <= server.throttled else 200
+        self.send_response(status)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        pass
+
+
+class TestSignedSession(unittest.TestCase):
+    """
+    Tests for signed_session
+    """
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), ThrottlingHandler)
+        self.server.received = []
+        self.server.throttled = 0
+        self.server.throttle_status = 503
+        thread = threading.Thread(target=self.server.serve_forever, args=(0.01,))
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = 'http://127.0.0.1:%d/_bulk' % self.server.server_port
+
+        self.auth = AWSRequestsAuth(aws_access_key='YOURKEY',
+                                    aws_secret_access_key='YOURSECRET',
+                                    aws_host='search-foo.us-east-1.es.amazonaws.com',
+                                    aws_region='us-east-1',
+                                    aws_service='es',
+                                    stats=SigningStats())
+        self.session = signed_session(self.auth, concurrency=4,
+                                      max_retries=Retry(total=2, backoff_factor=0, status_forcelist=(503,),
+                                                        allowed_methods=None))
+        self.addCleanup(self.session.close)
+
+    def test_pool_size(self):
+        adapter = self.session.get_adapter(self.url)
+        self.assertEqual(4, adapter._pool_maxsize)
+        self.assertIs(self.auth, self.session.auth)
+
+    def test_connection_reuse(self):
+        for _ in range(3):
+            self.assertEqual(200, self.session.get(self.url).status_code)
+        self.assertEqual({
+            'pools': 1,
+            'connections_opened': 1,
+            'requests': 3,
+            'connections_reused': 2,
+            'reuse_rate': 2.0 / 3,
+        }, self.session.get_adapter(self.url).connection_stats())
+
+    def test_retry_resigns_without_rehashing(self):
+        self.server.throttled = 2
+        body = b'{"index": {}}\n' * 1000
+        response = self.session.post(self.url, data=body)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([503, 503], [r.status_code for r in response.history])
+        self.assertEqual(3, len(self.server.received))
+        self.assertTrue(all('Authorization' in headers for headers in self.server.received))
+        stats = self.auth.stats.snapshot()
+        self.assertEqual(3, stats['requests'])
+        self.assertEqual(len(body), stats['bytes_hashed'])
+        self.assertEqual(1, self.session.get_adapter(self.url).connection_stats()['connections_opened'])
+
+    def test_retries_exhausted(self):
+        self.server.throttled = 5
+        response = self.session.get(self.url)
+        self.assertEqual(503, response.status_code)
+        self.assertEqual(3, len(self.server.received))
+
+    def test_stream_not_retried(self):
+        self.server.throttled = 1
+        response = self.session.post(self.url, data=iter([b'foo', b'bar']))
+        self.assertEqual(503, response.status_code)
+        self.assertEqual(1, len(self.server.received))
+
+    def test_default_retries_throttled_posts(self):
+        session = signed_session(self.auth, max_retries=2, backoff_factor=0)
+        self.addCleanup(session.close)
+        for status in (429, 503):
+            del self.server.received[:]
+            self.server.throttled = 1
+            self.server.throttle_status = status
+            response = session.post(self.url, data=b'{"index": {}}\n')
+            self.assertEqual(200, response.status_code)
+            self.assertEqual([status], [r.status_code for r in response.history])
+
+        # the request may have been processed
+        del self.server.received[:]
+        self.server.throttle_status = 500
+        self.assertEqual(500, session.post(self.url, data=b'{"index": {}}\n').status_code)
+        self.assertEqual(1, len(self.server.received))
+        self.assertEqual(200, session.get(self.url).status_code)
@@ -0,0 +1,122 @@
+import binascii
+import datetime
+import pickle
+import unittest
+
+import mock
+import requests
+
+from aws_requests_auth.signing import STREAMING_PAYLOAD
+
+try:
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from aws_requests_auth.sigv4a import (AWSSigV4ARequestsAuth, BotoAWSSigV4ARequestsAuth, PrivateKeyCache,
+                                          derive_private_key)
+except ImportError:
+    ec = None
+
+
+@unittest.skipIf(ec is None, 'cryptography is not installed')
+class TestSigV4A(unittest.TestCase):
+    """
+    Tests for signature version 4A
+    """
+
+    def setUp(self):
+        self.auth = AWSSigV4ARequestsAuth(aws_access_key='AKIDEXAMPLE',
+                                          aws_secret_access_key='wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY',
+                                          aws_host='example.amazonaws.com',
+                                          aws_region=['us-east-1', 'us-west-2'],
+                                          aws_service='service')
+        self.strings_to_sign = []
+        compute_signature = self.auth.compute_signature
+
+        def record_string_to_sign(signing_key, string_to_sign):
+            self.strings_to_sign.append(string_to_sign)
+            return compute_signature(signing_key, string_to_sign)
+
+        self.auth.compute_signature = record_string_to_sign
+
+    def _sign(self, url='http://example.amazonaws.com/?Param1=value1', method='GET', data=None):
+        request = requests.Request(method, url, data=data).prepare()
+        frozen_datetime = datetime.datetime(2015, 8, 30, 12, 36, 0)
+        with mock.patch('datetime.datetime') as mock_datetime:
+            mock_datetime.utcnow.return_value = frozen_datetime
+            self.auth(request)
+        return request
+
+    def test_derive_private_key(self):
+        """
+        Matches the public key of the AWS SDKs' SigV4A test suite
+        """
+        public_numbers = derive_private_key('AKIDEXAMPLE',
+                                            'wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY').public_key().public_numbers()
+        self.assertEqual(0xb6618f6a65740a99e650b33b6b4b5bd0d43b176d721a3edfea7e7d2d56d936b1, public_numbers.x)
+        self.assertEqual(0x865ed22a7eadc9c5cb9d2cbaca1b3699139fedc5043dc6661864218330c8e518, public_numbers.y)
+
+    def test_headers(self):
+        request = self._sign()
+        self.assertEqual('us-east-1,us-west-2', request.headers['X-Amz-Region-Set'])
+        self.assertEqual('20150830T123600Z', request.headers['x-amz-date'])
+        authorization = request.headers['Authorization']
+        self.assertTrue(authorization.startswith(
+            'AWS4-ECDSA-P256-SHA256 Credential=AKIDEXAMPLE/20150830/service/aws4_request, '
+            'SignedHeaders=host;x-amz-date;x-amz-region-set, Signature='))
+        string_to_sign = self.strings_to_sign[0].split('\n')
+        self.assertEqual(['AWS4-ECDSA-P256-SHA256', '20150830T123600Z', '20150830/service/aws4_request'],
+                         string_to_sign[:3])
+
+    def test_signature_verifies(self):
+        request = self._sign(method='POST', data=b'foo=bar')
+        signature = binascii.unhexlify(request.headers['Authorization'].rsplit('Signature=', 1)[1])
+        public_key = derive_private_key('AKIDEXAMPLE', 'wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY').public_key()
+        # raises InvalidSignature if the signature does not match
+        public_key.verify(signature, self.strings_to_sign[0].encode('utf-8'), ec.ECDSA(hashes.SHA256()))
+
+    def test_presigned_url(self):
+        frozen_datetime = datetime.datetime(2015, 8, 30, 12, 36, 0)
+        with mock.patch('datetime.datetime') as mock_datetime:
+            mock_datetime.utcnow.return_value = frozen_datetime
+            url = self.auth.get_presigned_url('http://example.amazonaws.com/', expires=60)
+        self.assertIn('X-Amz-Algorithm=AWS4-ECDSA-P256-SHA256&', url)
+        self.assertIn('X-Amz-Credential=AKIDEXAMPLE%2F20150830%2Fservice%2Faws4_request&', url)
+        self.assertIn('&X-Amz-Region-Set=us-east-1%2Cus-west-2&', url)
+
+    def test_private_key_cache(self):
+        self._sign()
+        self._sign()
+        cache = self.auth.signing_key_cache
+        self.assertEqual((1, 1), (cache.misses, cache.hits))
+        self.assertEqual(1, len(cache))
+        cache.invalidate('wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY')
+        self.assertEqual(0, len(cache))
+
+    def test_pickle_private_key_cache(self):
+        cache = PrivateKeyCache()
+        cache.lookup('AKIDEXAMPLE', 'wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY')
+        unpickled = pickle.loads(pickle.dumps(cache))
+        self.assertEqual(0, len(unpickled))
+        self.assertFalse(unpickled.lookup('AKIDEXAMPLE', 'wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY')[1])
+
+    def test_streaming_payload_unsupported(self):
+        with self.assertRaises(ValueError):
+            AWSSigV4ARequestsAuth(aws_access_key='AKIDEXAMPLE',
+                                  aws_secret_access_key='wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY',
+                                  aws_host='example.amazonaws.com',
+                                  aws_region='*',
+                                  aws_service='s3',
+                                  payload_signing=STREAMING_PAYLOAD)
+
+    @mock.patch('aws_requests_auth.boto_utils.Session')
+    def test_boto_credentials(self, mock_session):
+        credentials = mock.Mock()
+        credentials.get_frozen_credentials.return_value = mock.Mock(
+            access_key='AKIDEXAMPLE', secret_key='wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY', token=None)
+        mock_session.return_value.get_credentials.return_value = credentials
+        auth = BotoAWSSigV4ARequestsAuth(aws_host='example.amazonaws.com', aws_region='*', aws_service='s3')
+        request = requests.Request('GET', 'http://example.amazonaws.com/').prepare()
+        auth(request)
+        self.assertTrue(request.headers['Authorization'].startswith(
+            'AWS4-ECDSA-P256-SHA256 Credential=AKIDEXAMPLE/'))
+        self.assertEqual('*', request.headers['X-Amz-Region-Set'])
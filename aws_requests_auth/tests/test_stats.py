@@ -0,0 +1,74 @@
+import io
+import unittest
+
+import mock
+
+from aws_requests_auth.aws_auth import AWSRequestsAuth, SignatureCache
+from aws_requests_auth.stats import PHASES, SigningStats
+
+
+class TestSigningStats(unittest.TestCase):
+
+    def make_auth(self, **kwargs):
+        return AWSRequestsAuth(aws_access_key='YOURKEY',
+                               aws_secret_access_key='YOURSECRET',
+                               aws_host='search-foo.us-east-1.es.amazonaws.com',
+                               aws_region='us-east-1',
+                               aws_service='es',
+                               **kwargs)
+
+    def make_request(self, body=None):
+        mock_request = mock.Mock()
+        mock_request.url = 'https://search-foo.us-east-1.es.amazonaws.com/_bulk'
+        mock_request.method = 'POST'
+        mock_request.body = body
+        mock_request.headers = {}
+        return mock_request
+
+    def test_records_phases_bytes_and_cache_lookups(self):
+        stats = SigningStats()
+        auth = self.make_auth(stats=stats)
+        auth(self.make_request(b'x' * 1000))
+        auth(self.make_request(io.BytesIO(b'x' * 500)))
+
+        snapshot = stats.snapshot()
+        self.assertEqual(2, snapshot['requests'])
+        self.assertEqual(1500, snapshot['bytes_hashed'])
+        for phase in PHASES:
+            self.assertGreater(snapshot[phase + '_seconds'], 0)
+        self.assertEqual(1, snapshot['signing_key_cache_hits'])
+        self.assertEqual(1, snapshot['signing_key_cache_misses'])
+        self.assertEqual(0.5, snapshot['signing_key_cache_hit_rate'])
+        self.assertIsNone(snapshot['signature_cache_hit_rate'])
+
+        stats.reset()
+        self.assertEqual(0, stats.snapshot()['requests'])
+
+    def test_signature_cache_hits(self):
+        stats = SigningStats()
+        auth = self.make_auth(stats=stats, signature_cache=SignatureCache())
+        auth(self.make_request(b'{}'))
+        auth(self.make_request(b'{}'))
+        snapshot = stats.snapshot()
+        self.assertEqual(2, snapshot['requests'])
+        self.assertEqual(1, snapshot['signature_cache_hits'])
+        self.assertEqual(1, snapshot['signature_cache_misses'])
+
+    def test_listener(self):
+        observations = []
+        auth = self.make_auth(stats=SigningStats(listener=lambda metric, value: observations.append(metric)))
+        auth(self.make_request(b'{}'))
+        self.assertEqual(['hash_payload_seconds', 'bytes_hashed', 'canonicalize_seconds', 'derive_key_seconds',
+                          'signing_key_cache_misses', 'sign_seconds', 'requests'], observations)
+
+    def test_listener_sees_each_phase_once(self):
+        observations = []
+        auth = self.make_auth(stats=SigningStats(listener=lambda metric, value: observations.append(metric)),
+                              signature_cache=SignatureCache())
+        for _ in range(2):
+            del observations[:]
+            auth(self.make_request(b'{}'))
+            for metric in set(observations):
+                self.assertEqual(1, observations.count(metric), metric)
+        self.assertIn('signature_cache_hits', observations)
+        self.assertIn('canonicalize_seconds', observations)
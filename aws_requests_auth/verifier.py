@@ -0,0 +1,273 @@
+"""
+Verification of signature version 4 signed requests, for services standing
+in for AWS: local fakes for integration tests, internal gateways and
+proxies.
+
+The canonical request is rebuilt with the same canonicalization as
+AWSSigV4Signer, and signatures are compared in constant time.
+"""
+
+import calendar
+import hashlib
+import hmac
+from collections import namedtuple
+
+try:
+    # python 2
+    from urllib import unquote
+    from urlparse import urlsplit
+except ImportError:
+    # python 3
+    from urllib.parse import unquote, urlsplit
+
+from .signing import (MAX_PRESIGN_EXPIRES, SIGV4_ALGORITHM, STREAMING_PAYLOAD, UNSIGNED_PAYLOAD,
+                      SigningClock, SigningKeyCache, _canonical_header_items, _content_sha256,
+                      _header_text, canonical_path, canonical_querystring, hash_payload)
+
+# How far from the verifier's time requests may be signed, like most AWS
+# services do
+MAX_CLOCK_SKEW = 5 * 60
+
+# Prefix of the query string parameters of presigned urls
+PRESIGN_PARAMETER_PREFIX = 'X-Amz-'
+
+
+class SignatureError(ValueError):
+    """
+    Raised when a request is not properly signed. `code` is the error code
+    AWS answers with in the same situation, e.g. SignatureDoesNotMatch or
+    RequestTimeTooSkewed, which stand-ins can send back to their clients.
+    """
+
+    def __init__(self, code, message):
+        super(SignatureError, self).__init__(message)
+        self.code = code
+
+
+# The credential a request was verified to be signed with
+VerifiedCredential = namedtuple('VerifiedCredential', ['access_key', 'datestamp', 'region', 'service'])
+
+
+def _amzdate_timestamp(amzdate):
+    """
+    Returns the POSIX timestamp of an x-amz-date (YYYYMMDDTHHMMSSZ), or
+    None if it is malformed
+    """
+    if len(amzdate) != 16 or amzdate[8] != 'T' or amzdate[15] != 'Z':
+        return None
+    try:
+        return calendar.timegm((int(amzdate[0:4]), int(amzdate[4:6]), int(amzdate[6:8]),
+                                int(amzdate[9:11]), int(amzdate[11:13]), int(amzdate[13:15])))
+    except ValueError:
+        return None
+
+
+class AWSSigV4Verifier(object):
+    """
+    Verifies that requests are signed with signature version 4 by one of the
+    credentials of `secret_keys`, a mapping of access key to secret key (any
+    object with a get() method).
+
+    Both requests signed in their Authorization header and presigned urls
+    are verified. With `aws_region` and `aws_service`, requests must also be
+    signed for them. Requests must be signed within `max_clock_skew` seconds
+    of the time of `signing_clock`.
+
+    Signing keys are cached in `signing_key_cache` per secret key, date,
+    region and service, so verifying a request costs two sha256 and one HMAC
+    on top of hashing its body. Session tokens (x-amz-security-token) are
+    checked to be signed, but not validated, and the chunk signatures of
+    STREAMING-AWS4-HMAC-SHA256-PAYLOAD bodies are not verified.
+    """
+
+    def __init__(self,
+                 secret_keys,
+                 aws_region=None,
+                 aws_service=None,
+                 max_clock_skew=MAX_CLOCK_SKEW,
+                 signing_key_cache=None,
+                 signing_clock=None):
+        self.secret_keys = secret_keys
+        self.region = aws_region
+        self.service = aws_service
+        self.max_clock_skew = max_clock_skew
+        self.signing_key_cache = signing_key_cache if signing_key_cache is not None else SigningKeyCache()
+        self.signing_clock = signing_clock if signing_clock is not None else SigningClock()
+
+    def verify_request(self, r):
+        """
+        verify() for a request object with `method`, `url`, `headers` and
+        `body` attributes, like a requests.PreparedRequest or a SigningRequest
+        """
+        return self.verify(r.method, r.url, r.headers, r.body)
+
+    def verify(self, method, url, headers, body=None):
+        """
+        Verifies the signature of a request and returns the
+        VerifiedCredential it was signed with, or raises a SignatureError.
+
+        `url` is the full url, or the path and query string, the request was
+        sent to; the Host header defaults to the host of a full url.
+        `headers` is a mapping, or any object with items() yielding repeated
+        headers more than once (e.g. an email.message.Message).
+        `body` is the bytes or text of the body, or a seekable file object;
+        it is hashed unless it is None and the x-amz-content-sha256 header is
+        signed.
+        """
+        headers = [(name.lower(), _header_text(value)) for name, value in headers.items()]
+        header_values = dict(headers)
+        parsedurl = urlsplit(url)
+        if 'host' not in header_values and parsedurl.netloc:
+            # e.g. a client-side request object, whose Host header is only
+            # added when it is sent
+            headers.append(('host', parsedurl.netloc))
+
+        authorization = header_values.get('authorization')
+        if authorization is not None:
+            credential, signed_headers, signature = self._parse_authorization(authorization)
+            amzdate = header_values.get('x-amz-date')
+            if amzdate is None:
+                raise SignatureError('IncompleteSignature', 'The x-amz-date header is missing')
+            query = parsedurl.query
+            expires = None
+        elif PRESIGN_PARAMETER_PREFIX + 'Signature=' in parsedurl.query:
+            credential, signed_headers, signature, amzdate, expires, query = self._parse_presigned_query(
+                parsedurl.query)
+        else:
+            raise SignatureError('MissingAuthenticationToken', 'The request is not signed')
+
+        access_key, datestamp, region, service = self._parse_credential(credential, amzdate)
+        self._check_time(amzdate, expires)
+        secret_key = self.secret_keys.get(access_key)
+        if secret_key is None:
+            raise SignatureError('InvalidClientTokenId', 'Unknown access key %r' % access_key)
+
+        signed_header_names = signed_headers.split(';')
+        if 'host' not in signed_header_names:
+            raise SignatureError('SignatureDoesNotMatch', 'The host header must be signed')
+        signed_header_set = frozenset(signed_header_names)
+        canonical_header_items = _canonical_header_items(item for item in headers if item[0] in signed_header_set)
+        if len(canonical_header_items) != len(signed_header_set):
+            raise SignatureError('SignatureDoesNotMatch', 'A signed header is missing from the request')
+        if 'x-amz-security-token' in header_values and 'x-amz-security-token' not in signed_header_set:
+            raise SignatureError('SignatureDoesNotMatch', 'The x-amz-security-token header must be signed')
+
+        if expires is not None:
+            payload_hash = UNSIGNED_PAYLOAD if service == 's3' else hash_payload(body)[0]
+        elif 'x-amz-content-sha256' in signed_header_set:
+            payload_hash = self._signed_payload_hash(header_values['x-amz-content-sha256'], body)
+        else:
+            payload_hash = hash_payload(body)[0]
+
+        canonical_request = (method.upper() + '\n' + canonical_path(parsedurl.path) + '\n' +
+                             canonical_querystring(query) + '\n' +
+                             ''.join(name + ':' + value + '\n' for name, value in canonical_header_items) + '\n' +
+                             signed_headers + '\n' + payload_hash)
+        credential_scope = datestamp + '/' + region + '/' + service + '/aws4_request'
+        string_to_sign = (SIGV4_ALGORITHM + '\n' + amzdate + '\n' + credential_scope + '\n' +
+                          hashlib.sha256(canonical_request.encode('utf-8')).hexdigest())
+        signing_key, _ = self.signing_key_cache.lookup(secret_key, datestamp, region, service)
+        expected_signature = hmac.new(signing_key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(expected_signature.encode('ascii'), signature.encode('ascii', 'replace')):
+            raise SignatureError('SignatureDoesNotMatch',
+                                 'The request signature does not match the signature computed')
+        return VerifiedCredential(access_key, datestamp, region, service)
+
+    @staticmethod
+    def _parse_authorization(authorization):
+        """
+        Returns the (credential, signed headers, signature) of an
+        Authorization header
+        """
+        algorithm, _, parameters = authorization.partition(' ')
+        if algorithm != SIGV4_ALGORITHM:
+            raise SignatureError('IncompleteSignature', 'Unsupported signing algorithm %r' % algorithm)
+        values = {}
+        for parameter in parameters.split(','):
+            name, _, value = parameter.strip().partition('=')
+            values[name] = value
+        try:
+            return values['Credential'], values['SignedHeaders'], values['Signature']
+        except KeyError as e:
+            raise SignatureError('IncompleteSignature', 'The Authorization header has no %s' % e.args[0])
+
+    @staticmethod
+    def _parse_presigned_query(query):
+        """
+        Returns the (credential, signed headers, signature, x-amz-date,
+        expires, query string without the signature) of a presigned url
+        """
+        values = {}
+        signed_params = []
+        for param in query.split('&'):
+            name, _, value = param.partition('=')
+            if name.startswith(PRESIGN_PARAMETER_PREFIX):
+                values[name[len(PRESIGN_PARAMETER_PREFIX):]] = unquote(value)
+            if name != PRESIGN_PARAMETER_PREFIX + 'Signature':
+                signed_params.append(param)
+        if values.get('Algorithm') != SIGV4_ALGORITHM:
+            raise SignatureError('IncompleteSignature', 'Unsupported signing algorithm %r' % values.get('Algorithm'))
+        try:
+            expires = int(values['Expires'])
+            return (values['Credential'], values['SignedHeaders'], values['Signature'], values['Date'],
+                    expires, '&'.join(signed_params))
+        except KeyError as e:
+            raise SignatureError('AuthorizationQueryParametersError',
+                                 'The presigned url has no %s%s' % (PRESIGN_PARAMETER_PREFIX, e.args[0]))
+        except ValueError:
+            raise SignatureError('AuthorizationQueryParametersError', 'X-Amz-Expires is not a number')
+
+    def _parse_credential(self, credential, amzdate):
+        """
+        Returns the (access key, date, region, service) of a credential,
+        checking its scope
+        """
+        parts = credential.split('/')
+        if len(parts) != 5 or parts[4] != 'aws4_request':
+            raise SignatureError('IncompleteSignature', 'Malformed credential %r' % credential)
+        access_key, datestamp, region, service, _ = parts
+        if datestamp != amzdate[:8]:
+            raise SignatureError('SignatureDoesNotMatch', 'The credential date does not match x-amz-date')
+        if self.region is not None and region != self.region:
+            raise SignatureError('SignatureDoesNotMatch', 'The credential should be scoped to %r' % self.region)
+        if self.service is not None and service != self.service:
+            raise SignatureError('SignatureDoesNotMatch',
+                                 'The credential should be scoped to the %r service' % self.service)
+        return access_key, datestamp, region, service
+
+    def _check_time(self, amzdate, expires):
+        """
+        Checks that a request signed at `amzdate` is not too far from the
+        current time, and that a presigned url did not expire
+        """
+        signed_at = _amzdate_timestamp(amzdate)
+        if signed_at is None:
+            raise SignatureError('IncompleteSignature', 'Malformed x-amz-date %r' % amzdate)
+        now = calendar.timegm(self.signing_clock.now().utctimetuple())
+        if expires is not None:
+            if not 0 < expires <= MAX_PRESIGN_EXPIRES:
+                raise SignatureError('AuthorizationQueryParametersError', 'X-Amz-Expires is out of range')
+            if now > signed_at + expires:
+                raise SignatureError('RequestExpired', 'The presigned url expired')
+            if signed_at - now > self.max_clock_skew:
+                raise SignatureError('RequestTimeTooSkewed', 'The presigned url is not valid yet')
+        elif abs(now - signed_at) > self.max_clock_skew:
+            raise SignatureError('RequestTimeTooSkewed',
+                                 'The difference between the request time and the current time is too large')
+
+    @staticmethod
+    def _signed_payload_hash(content_sha256, body):
+        """
+        Returns the payload hash of a request signing its
+        x-amz-content-sha256 header, checking it against the body if there is
+        one
+        """
+        if content_sha256 in (UNSIGNED_PAYLOAD, STREAMING_PAYLOAD):
+            return content_sha256
+        payload_hash = _content_sha256({'x-amz-content-sha256': content_sha256})
+        if payload_hash is None:
+            raise SignatureError('InvalidArgument', 'x-amz-content-sha256 must be a sha256 hex digest')
+        if body is not None and hash_payload(body)[0] != payload_hash:
+            raise SignatureError('XAmzContentSHA256Mismatch',
+                                 'The x-amz-content-sha256 does not match the body of the request')
+        return payload_hash
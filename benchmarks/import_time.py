@@ -0,0 +1,71 @@
+"""
+Import time of the modules of aws_requests_auth, each measured in a fresh
+interpreter. Run from the root of the repository:
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --output import_time.json
+
+Also tells which heavy dependencies (requests, botocore) each import pulls
+in: the signing core needs neither, and botocore is only imported once a
+botocore auth object is built.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+MODULES = (
+    'aws_requests_auth.signing',
+    'aws_requests_auth.aws_auth',
+    'aws_requests_auth.routing',
+    'aws_requests_auth.boto_utils',
+)
+
+DEPENDENCIES = ('requests', 'botocore')
+
+SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import %s
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds, 'loaded': [name for name in %r if name in sys.modules]}))
+'''
+
+
+def measure(module, runs):
+    """
+    Returns the median time to import `module` over `runs` fresh
+    interpreters, and the DEPENDENCIES it loaded
+    """
+    samples = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', SCRIPT % (module, DEPENDENCIES)])
+        samples.append(json.loads(output.decode('utf-8')))
+    samples.sort(key=lambda sample: sample['seconds'])
+    median = samples[len(samples) // 2]
+    return {'ms': median['seconds'] * 1e3, 'loaded': median['loaded']}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=9, help='interpreters started per module')
+    parser.add_argument('--output', help='write the results as json to this file')
+    args = parser.parse_args(argv)
+
+    # import every module once first, so that their bytecode is cached
+    subprocess.check_call([sys.executable, '-c', 'import ' + ', '.join(MODULES)])
+    results = {}
+    for module in MODULES:
+        results[module] = measure(module, args.runs)
+        print('%-30s %8.1f ms   loads: %s' % (module, results[module]['ms'],
+                                                ', '.join(results[module]['loaded']) or '-'))
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'python': sys.version.split()[0], 'results': results}, output, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""
+Microbenchmark of the per-request cost of AWSRequestsAuth, comparing a warm
+SigningContext (reused across requests, the default) with a cold one
+(rebuilt for every request, which is what signing cost before the context
+existed).
+
+    python -m benchmarks.signing_context  # python 3.9+
+
+Reports the time per call and the peak memory allocated while signing one
+request (transient strings included), as traced by tracemalloc.
+"""
+
+import timeit
+import tracemalloc
+
+from aws_requests_auth.aws_auth import AWSRequestsAuth
+from aws_requests_auth.signing import SigningContext, SigningRequest
+
+CALLS = 20000
+
+
+def make_auth():
+    return AWSRequestsAuth(aws_access_key='YOURKEY',
+                           aws_secret_access_key='YOURSECRET',
+                           aws_host='search-foo.us-east-1.es.amazonaws.com',
+                           aws_region='us-east-1',
+                           aws_service='es',
+                           aws_token='YOURTOKEN')
+
+
+def warm(auth, request):
+    auth.get_aws_request_headers_handler(request)
+
+
+def cold(auth, request):
+    auth.signing_context = SigningContext(auth.aws_host, auth.aws_region, auth.service)
+    auth.get_aws_request_headers_handler(request)
+
+
+def peak_bytes_per_call(func, auth, request, calls=100):
+    func(auth, request)
+    tracemalloc.start()
+    peaks = []
+    for _ in range(calls):
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        func(auth, request)
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    return min(peaks)
+
+
+def main():
+    request = SigningRequest('GET', 'https://search-foo.us-east-1.es.amazonaws.com/my_index/_search?q=foo')
+    for name, func in (('warm context', warm), ('cold context', cold)):
+        auth = make_auth()
+        seconds = min(timeit.repeat(lambda: func(auth, request), number=CALLS, repeat=3))
+        print('%-14s %8.2f us/call %8d peak bytes/call' % (
+            name, seconds / CALLS * 1e6, peak_bytes_per_call(func, auth, request)))
+
+
+if __name__ == '__main__':
+    main()
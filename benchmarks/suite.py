@@ -0,0 +1,260 @@
+"""
+Signing throughput and latency benchmarks, runnable offline (botocore
+credentials are stubbed). Run from the root of the repository:
+
+    python -m benchmarks.suite                              # print results
+    python -m benchmarks.suite --output results.json        # save results
+    python -m benchmarks.suite --baseline results.json      # compare
+
+With --baseline, exits with status 1 if any benchmark's throughput dropped
+by more than --max-regression (20% by default) compared to the baseline.
+Baselines are machine specific: record them on the machine that compares.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+from unittest import mock
+
+import requests
+from botocore.credentials import RefreshableCredentials
+
+from aws_requests_auth.aws_auth import AWSRequestsAuth, PayloadHashCache
+from aws_requests_auth.boto_utils import BotoAWSRequestsAuth
+from aws_requests_auth.stats import SigningStats
+from aws_requests_auth.verifier import AWSSigV4Verifier
+
+try:
+    from aws_requests_auth.sigv4a import AWSSigV4ARequestsAuth
+except ImportError:
+    # cryptography is not installed
+    AWSSigV4ARequestsAuth = None
+
+ES_HOST = 'search-foo.us-east-1.es.amazonaws.com'
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def make_auth(**kwargs):
+    return AWSRequestsAuth(aws_access_key='YOURKEY',
+                           aws_secret_access_key='YOURSECRET',
+                           aws_host=ES_HOST,
+                           aws_region='us-east-1',
+                           aws_service='es',
+                           **kwargs)
+
+
+def prepare(method='GET', path='/', body=None):
+    return requests.Request(method, 'https://' + ES_HOST + path, data=body).prepare()
+
+
+class Resent(object):
+    """
+    Stands in for a prepared request sent again as-is: copy() returns the
+    request itself
+    """
+
+    def __init__(self, request):
+        self.request = request
+
+    def copy(self):
+        return self.request
+
+
+def stub_refreshable_credentials():
+    """
+    botocore refreshable credentials that expire in an hour and never
+    touch the network
+    """
+    def refresh():
+        expiry_time = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() + 3600))
+        return {
+            'access_key': 'YOURKEY',
+            'secret_key': 'YOURSECRET',
+            'token': 'YOURTOKEN',
+            'expiry_time': expiry_time,
+        }
+    return RefreshableCredentials.create_from_metadata(refresh(), refresh, 'stub')
+
+
+@benchmark('get_empty_body')
+def get_empty_body():
+    return make_auth(), prepare()
+
+
+@benchmark('get_empty_body_stats')
+def get_empty_body_stats():
+    return make_auth(stats=SigningStats()), prepare()
+
+
+@benchmark('post_1mb_body')
+def post_1mb_body():
+    return make_auth(), prepare('POST', '/_bulk', b'{"index": {}}\n{"foo": "bar"}\n' * 36000)
+
+
+@benchmark('post_1mb_body_cached_hash')
+def post_1mb_body_cached_hash():
+    return (make_auth(payload_hash_cache=PayloadHashCache()),
+            prepare('POST', '/_bulk', b'{"index": {}}\n{"foo": "bar"}\n' * 36000))
+
+
+@benchmark('post_1mb_body_resign')
+def post_1mb_body_resign():
+    auth = make_auth()
+    request = auth(prepare('POST', '/_bulk', b'{"index": {}}\n{"foo": "bar"}\n' * 36000))
+    return auth.resign, Resent(request)
+
+
+@benchmark('post_16mb_body')
+def post_16mb_body():
+    return make_auth(), prepare('POST', '/_bulk', b'x' * (16 * 1024 * 1024))
+
+
+@benchmark('get_long_querystring')
+def get_long_querystring():
+    querystring = '&'.join('param%d=value %d' % (i, i) for i in range(100))
+    return make_auth(), prepare(path='/my_index/_search?' + querystring)
+
+
+@benchmark('put_signed_headers')
+def put_signed_headers():
+    auth = make_auth(signed_headers=['content-type', 'content-md5', 'x-amz-*'])
+    request = prepare('PUT', '/my_index/_doc/1', b'{"foo": "bar"}')
+    request.headers.update({
+        'Content-Type': 'application/json',
+        'Content-MD5': 'lVFk1E0pivuZC4M5pn0Yuw==',
+        'x-amz-meta-owner': 'foo',
+        'x-amz-storage-class': 'STANDARD',
+    })
+    return auth, request
+
+
+@benchmark('get_sts_token')
+def get_sts_token():
+    return make_auth(aws_token='YOURTOKEN' * 40), prepare()
+
+
+if AWSSigV4ARequestsAuth is not None:
+    @benchmark('get_sigv4a')
+    def get_sigv4a():
+        auth = AWSSigV4ARequestsAuth(aws_access_key='YOURKEY',
+                                     aws_secret_access_key='YOURSECRET',
+                                     aws_host=ES_HOST,
+                                     aws_region='*',
+                                     aws_service='es')
+        return auth, prepare()
+
+
+@benchmark('verify_get_empty_body')
+def verify_get_empty_body():
+    return AWSSigV4Verifier({'YOURKEY': 'YOURSECRET'}).verify_request, make_auth()(prepare())
+
+
+@benchmark('verify_post_1mb_body')
+def verify_post_1mb_body():
+    return (AWSSigV4Verifier({'YOURKEY': 'YOURSECRET'}).verify_request,
+            make_auth()(prepare('POST', '/_bulk', b'{"index": {}}\n{"foo": "bar"}\n' * 36000)))
+
+
+@benchmark('get_boto')
+def get_boto():
+    with mock.patch('aws_requests_auth.boto_utils.Session') as session:
+        session.return_value.get_credentials.return_value = stub_refreshable_credentials()
+        auth = BotoAWSRequestsAuth(aws_host=ES_HOST, aws_region='us-east-1', aws_service='es')
+    return auth, prepare()
+
+
+@benchmark('get_boto_background_refresh')
+def get_boto_background_refresh():
+    with mock.patch('aws_requests_auth.boto_utils.Session') as session:
+        session.return_value.get_credentials.return_value = stub_refreshable_credentials()
+        auth = BotoAWSRequestsAuth(aws_host=ES_HOST, aws_region='us-east-1', aws_service='es',
+                                   background_refresh_interval=60)
+    return auth, prepare()
+
+
+def run(setup, min_time):
+    """
+    Signs copies of the request returned by `setup`, with the signing
+    callable it returns too, repeatedly for at least `min_time` seconds, and returns throughput and latency statistics
+    """
+    sign, request = setup()
+    sign(request.copy())  # warm up caches
+    latencies = []
+    perf_counter = time.perf_counter
+    deadline = perf_counter() + min_time
+    while perf_counter() < deadline or len(latencies) < 10:
+        r = request.copy()
+        start = perf_counter()
+        sign(r)
+        latencies.append(perf_counter() - start)
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        'calls': len(latencies),
+        'ops_per_sec': len(latencies) / total,
+        'mean_us': total / len(latencies) * 1e6,
+        'p50_us': latencies[len(latencies) // 2] * 1e6,
+        'p99_us': latencies[int(len(latencies) * 0.99)] * 1e6,
+    }
+
+
+def compare(results, baseline, max_regression):
+    """
+    Returns the names of the benchmarks slower than the baseline by more
+    than `max_regression`
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        change = result['ops_per_sec'] / baseline[name]['ops_per_sec'] - 1
+        flag = ''
+        if change < -max_regression:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print('%-30s %+7.1f%% vs baseline%s' % (name, change * 100, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--min-time', type=float, default=1.0,
+                        help='seconds to run each benchmark for')
+    parser.add_argument('--output', help='write the results as json to this file')
+    parser.add_argument('--baseline', help='json results to compare with')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='largest tolerated throughput drop, as a fraction of the baseline')
+    parser.add_argument('benchmarks', nargs='*', choices=[[]] + sorted(BENCHMARKS),
+                        help='benchmarks to run, all by default')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name in args.benchmarks or sorted(BENCHMARKS):
+        results[name] = run(BENCHMARKS[name], args.min_time)
+        print('%-30s %10.0f ops/s %10.1f us mean %10.1f us p99' % (
+            name, results[name]['ops_per_sec'], results[name]['mean_us'], results[name]['p99_us']))
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'python': platform.python_version(), 'results': results}, output, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline)['results'], args.max_regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -11,6 +11,9 @@ setup(
     description='AWS signature version 4 signing process for the python requests module',
     long_description='See https://github.com/davidmuller/aws-requests-auth for installation and usage instructions.',
     install_requires=['requests>=0.14.0'],
+    entry_points={
+        'console_scripts': ['aws-sigv4-proxy = aws_requests_auth.proxy:main'],
+    },
     classifiers=[
         'License :: OSI Approved :: BSD License',
         'Programming Language :: Python',